@@ -0,0 +1,29 @@
+"""Built-in task types, plus the fallback for types with no handler"""
+import asyncio
+
+from app.handlers import handler
+
+# Simulate different task types with FASTER processing
+
+# Email and data processing downstreams take bulk calls, so these run batched
+
+@handler("email", batchable=True)
+async def send_emails(payloads: list, task_ids: list) -> list:
+    await asyncio.sleep(0.1)  # Changed from 2 to 0.1
+    return [{"status": "email_sent", "to": payload.get("email")} for payload in payloads]
+
+@handler("data_processing", batchable=True)
+async def process_data(payloads: list, task_ids: list) -> list:
+    await asyncio.sleep(0.1)  # Changed from 3 to 0.1
+    return [{"status": "processed", "records": payload.get("count", 100)} for payload in payloads]
+
+@handler("report_generation")
+async def generate_report(payload: dict, task_id: int) -> dict:
+    await asyncio.sleep(0.5)  # Changed from 5 to 0.5
+    return {"status": "generated", "report_id": f"RPT-{task_id}"}
+
+@handler("*")
+async def default_task(payload: dict, task_id: int) -> dict:
+    # Default task processing
+    await asyncio.sleep(0.1)  # Changed from 1 to 0.1
+    return {"status": "completed", "data": payload}
@@ -0,0 +1,90 @@
+import json
+import sys
+from collections import OrderedDict
+
+from app.config import settings
+from app.models import TaskStatus
+from app.schemas import TaskResponse
+
+TERMINAL_STATUSES = (TaskStatus.COMPLETED, TaskStatus.FAILED)
+
+class TaskCache:
+    """LRU of tasks in a terminal state, capped by approximate memory use.
+
+    COMPLETED and FAILED rows no longer change, so reads of them can be
+    served from memory. Entries are dicts of TaskResponse fields; the parsed
+    result is kept alongside on first use. Deletes and any later change to
+    the task evict through the task event bus on every node.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # task_id -> (task dict, size)
+        self.parsed = {}  # task_id -> parsed result
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, task_id: int):
+        entry = self.entries.get(task_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(task_id)
+        return entry[0]
+
+    def result(self, task_id: int):
+        """Parsed JSON result of a cached task"""
+        if task_id not in self.parsed:
+            raw = self.entries[task_id][0]["result"]
+            self.parsed[task_id] = json.loads(raw) if raw else None
+        return self.parsed[task_id]
+
+    def remember(self, task):
+        """Cache a task read from the database if it is terminal"""
+        if task.status in TERMINAL_STATUSES:
+            self.put({name: getattr(task, name) for name in TaskResponse.model_fields})
+
+    def put(self, task: dict):
+        if self.max_bytes <= 0 or task["status"] not in TERMINAL_STATUSES:
+            return
+        # The result is counted twice to leave room for its parsed copy
+        size = sys.getsizeof(task) + sum(sys.getsizeof(value) for value in task.values())
+        size += sys.getsizeof(task["result"])
+        # One huge result shouldn't flush everything else
+        if size > self.max_bytes // 8:
+            return
+
+        self.evict(task["id"])
+        self.entries[task["id"]] = (task, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            self.evict(next(iter(self.entries)))
+
+    def evict(self, task_id: int):
+        entry = self.entries.pop(task_id, None)
+        if entry is not None:
+            self.size -= entry[1]
+        self.parsed.pop(task_id, None)
+
+    def clear(self):
+        self.entries.clear()
+        self.parsed.clear()
+        self.size = 0
+
+    def disable(self):
+        """Stop caching, for processes that don't serve reads or can't hear evictions"""
+        self.clear()
+        self.max_bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hit_rate_percent": round(self.hits / lookups * 100, 2) if lookups else 0
+        }
+
+task_cache = TaskCache(settings.TASK_CACHE_MAX_BYTES)
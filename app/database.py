@@ -1,3 +1,7 @@
+import asyncio
+
+import asyncpg
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 from app.config import settings
@@ -5,7 +9,16 @@ from app.config import settings
 # Convert postgresql:// to postgresql+asyncpg://
 DATABASE_URL = settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
 
-engine = create_async_engine(DATABASE_URL, echo=True, future=True)
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=settings.DB_ECHO,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    future=True
+)
+# Same pool; each statement commits on its own, so a single-statement write
+# costs one round trip instead of BEGIN / statement / COMMIT
+autocommit_engine = engine.execution_options(isolation_level="AUTOCOMMIT")
 async_session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 Base = declarative_base()
@@ -19,4 +32,70 @@ async def get_db():
 
 async def init_db():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await conn.run_sync(Base.metadata.create_all)
+
+async def notify(session: AsyncSession, channel: str, payload: str = ""):
+    """Queue a NOTIFY on the session's transaction (delivered on commit)"""
+    await session.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": channel, "payload": payload}
+    )
+
+class Listener:
+    """Dedicated LISTEN connection that reconnects when it drops.
+
+    Notifications sent while it is down are lost; on_reconnect lets the
+    owner resynchronize once it is back.
+    """
+
+    def __init__(self, channel: str, callback, application_name: str = None, on_reconnect=None):
+        self.channel = channel
+        self.callback = callback
+        self.application_name = application_name
+        self.on_reconnect = on_reconnect
+        self.conn = None
+        self.reconnecting = None
+        self.closing = False
+
+    async def connect(self):
+        server_settings = {"application_name": self.application_name} if self.application_name else None
+        self.conn = await asyncpg.connect(settings.DATABASE_URL, server_settings=server_settings)
+        await self.conn.add_listener(
+            self.channel,
+            lambda connection, pid, channel, payload: self.callback(payload)
+        )
+        self.conn.add_termination_listener(self.on_terminated)
+
+    def on_terminated(self, connection):
+        if not self.closing and self.reconnecting is None:
+            print(f"LISTEN connection for {self.channel} lost, reconnecting")
+            self.reconnecting = asyncio.create_task(self.reconnect())
+
+    async def reconnect(self):
+        delay = 1
+        while not self.closing:
+            await asyncio.sleep(delay)
+            try:
+                await self.connect()
+            except Exception as e:
+                print(f"Error reconnecting LISTEN for {self.channel}: {e}")
+                delay = min(delay * 2, 30)
+                continue
+            self.reconnecting = None
+            print(f"LISTEN connection for {self.channel} restored")
+            if self.on_reconnect:
+                self.on_reconnect()
+            return
+
+    async def close(self):
+        self.closing = True
+        if self.reconnecting:
+            self.reconnecting.cancel()
+        if self.conn and not self.conn.is_closed():
+            await self.conn.close()
+
+async def listen(channel: str, callback, application_name: str = None, on_reconnect=None) -> Listener:
+    """Open a dedicated connection that calls callback(payload) on every NOTIFY"""
+    listener = Listener(channel, callback, application_name, on_reconnect)
+    await listener.connect()
+    return listener
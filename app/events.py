@@ -0,0 +1,178 @@
+import asyncio
+import json
+import uuid
+from contextlib import contextmanager
+
+from app.cache import task_cache, TERMINAL_STATUSES
+from app.config import settings
+from app.database import listen, notify
+from app.models import TaskStatus
+
+# NOTIFY payloads are capped at 8000 bytes; task_type is at most 50 characters
+NOTIFY_CHUNK = 80
+
+class Subscription:
+    """Bounded queue of events for one stream subscriber.
+
+    A subscriber that falls EVENTS_QUEUE_SIZE events behind is marked lagged
+    and gets None instead of a silently incomplete stream.
+    """
+
+    def __init__(self, task_ids: set, task_type: str):
+        self.task_ids = task_ids
+        self.task_type = task_type
+        self.queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        self.lagged = False
+
+    def deliver(self, event: dict):
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.lagged = True
+
+    def cut_off(self):
+        """End the stream as lagged, waking it if it is waiting"""
+        self.lagged = True
+        if self.queue.empty():
+            self.queue.put_nowait(None)
+
+    async def get(self):
+        if self.lagged:
+            return None
+        return await self.queue.get()
+
+class TaskEvents:
+    """In-process bus for task state changes.
+
+    Claims and the completion writer publish what they commit directly to
+    this process and announce it on EVENTS_CHANNEL for every other node;
+    each node's listener feeds those into its own bus. Waiters and stream
+    subscribers are indexed by task id and task_type, so fan-out only
+    touches the subscribers an event matches and costs no queries. The
+    same notifications keep every node's task cache consistent.
+    """
+
+    def __init__(self):
+        self.node_id = uuid.uuid4().hex[:12]
+        self.waiters = {}  # task_id -> set of asyncio.Event
+        self.by_id = {}  # task_id -> set of Subscription
+        self.by_type = {}  # task_type -> set of Subscription
+        self.everything = set()  # subscriptions without filters
+        self.listener = None
+
+    async def start(self):
+        self.listener = await listen(
+            settings.EVENTS_CHANNEL, self.on_notify, on_reconnect=self.on_reconnect
+        )
+
+    def on_reconnect(self):
+        """Events missed while LISTEN was down can't be replayed: drop the
+        cache, let waiters re-read their task and cut streams off as lagged"""
+        task_cache.clear()
+        for events in self.waiters.values():
+            for event in events:
+                event.set()
+        subscriptions = set(self.everything)
+        for index in (self.by_id, self.by_type):
+            for indexed in index.values():
+                subscriptions.update(indexed)
+        for subscription in subscriptions:
+            subscription.cut_off()
+
+    async def stop(self):
+        if self.listener:
+            await self.listener.close()
+            self.listener = None
+
+    @contextmanager
+    def waiter(self, task_id: int):
+        """Event set once task_id reaches a terminal state.
+
+        Register before reading the task so a completion in between is not missed.
+        """
+        event = asyncio.Event()
+        self.waiters.setdefault(task_id, set()).add(event)
+        try:
+            yield event
+        finally:
+            self._discard(self.waiters, task_id, event)
+
+    @contextmanager
+    def subscribe(self, task_ids: set = None, task_type: str = None):
+        """Subscription to changes of any of task_ids or of task_type; all changes without either"""
+        subscription = Subscription(set(task_ids or ()), task_type)
+        keys = [(self.by_id, task_id) for task_id in subscription.task_ids]
+        if task_type:
+            keys.append((self.by_type, task_type))
+
+        for index, key in keys:
+            index.setdefault(key, set()).add(subscription)
+        if not keys:
+            self.everything.add(subscription)
+        try:
+            yield subscription
+        finally:
+            for index, key in keys:
+                self._discard(index, key, subscription)
+            self.everything.discard(subscription)
+
+    def _discard(self, index: dict, key, item):
+        items = index.get(key)
+        if items is not None:
+            items.discard(item)
+            if not items:
+                del index[key]
+
+    def publish(self, changes: list):
+        """Deliver committed (task_id, task_type, status) changes to local subscribers"""
+        for task_id, task_type, status in changes:
+            # Whatever the change, a cached copy of the row is now stale
+            task_cache.evict(task_id)
+            if status in TERMINAL_STATUSES:
+                for event in self.waiters.get(task_id, ()):
+                    event.set()
+
+            subscribers = self.everything.union(
+                self.by_id.get(task_id, ()), self.by_type.get(task_type, ())
+            )
+            if subscribers:
+                event = {"id": task_id, "task_type": task_type, "status": status.value}
+                for subscription in subscribers:
+                    subscription.deliver(event)
+
+    async def announce_deleted(self, session, task_ids: list):
+        """Queue a NOTIFY so every node drops these tasks from its cache"""
+        for start in range(0, len(task_ids), NOTIFY_CHUNK):
+            payload = json.dumps({"node": self.node_id, "deleted": task_ids[start:start + NOTIFY_CHUNK]})
+            await notify(session, settings.EVENTS_CHANNEL, payload)
+
+    async def announce(self, session, changes: list):
+        """Queue NOTIFYs for other nodes on the session's transaction"""
+        for start in range(0, len(changes), NOTIFY_CHUNK):
+            chunk = changes[start:start + NOTIFY_CHUNK]
+            payload = json.dumps({
+                "node": self.node_id,
+                "changes": [[task_id, task_type, status.name] for task_id, task_type, status in chunk]
+            })
+            await notify(session, settings.EVENTS_CHANNEL, payload)
+
+    def on_notify(self, payload: str):
+        try:
+            message = json.loads(payload)
+            # Our own changes were already published when they committed
+            if message["node"] == self.node_id:
+                return
+            for task_id in message.get("deleted", ()):
+                task_cache.evict(task_id)
+            changes = [
+                (task_id, task_type, TaskStatus[status])
+                for task_id, task_type, status in message.get("changes", ())
+            ]
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Ignoring malformed task event: {e}")
+            return
+        self.publish(changes)
+
+task_events = TaskEvents()
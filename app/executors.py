@@ -0,0 +1,108 @@
+import asyncio
+import json
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.config import settings
+
+def call_with_payload(func, payload: str, task_id: int):
+    """Runs in the child: parse the payload there so only the JSON text is pickled"""
+    return func(json.loads(payload), task_id)
+
+class HandlerExecutors:
+    """Executor pools for handlers that must not run on the event loop"""
+    
+    def __init__(self):
+        self.process_pool = None
+        self.thread_pool = None
+        # Blocking I/O pool metrics; active is updated from the pool threads
+        self.thread_lock = threading.Lock()
+        self.thread_submitted = 0
+        self.thread_active = 0
+        self.thread_completed = 0
+        self.thread_timeouts = 0
+    
+    def get_process_pool(self) -> ProcessPoolExecutor:
+        # Created on first use so nodes without CPU-bound handlers spawn nothing
+        if self.process_pool is None:
+            self.process_pool = ProcessPoolExecutor(
+                max_workers=settings.PROCESS_POOL_SIZE,
+                mp_context=multiprocessing.get_context(settings.PROCESS_START_METHOD)
+            )
+        return self.process_pool
+    
+    async def run_in_process(self, func, payload: str, task_id: int):
+        """Run func(parsed payload, task_id) in the process pool and await its result"""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self.get_process_pool(), call_with_payload, func, payload, task_id
+            )
+        except BrokenProcessPool:
+            # A child died; replace the pool so later tasks can still run
+            self.process_pool = None
+            raise
+    
+    def get_thread_pool(self) -> ThreadPoolExecutor:
+        # Separate from the loop's default executor so blocking handlers
+        # can't starve DNS lookups and other internal run_in_executor calls
+        if self.thread_pool is None:
+            self.thread_pool = ThreadPoolExecutor(
+                max_workers=settings.THREAD_POOL_SIZE,
+                thread_name_prefix="task-io"
+            )
+        return self.thread_pool
+    
+    def call_counted(self, func, payload: dict, task_id: int):
+        """Runs in a pool thread, tracking how many handlers are executing"""
+        with self.thread_lock:
+            self.thread_active += 1
+        try:
+            return func(payload, task_id)
+        finally:
+            with self.thread_lock:
+                self.thread_active -= 1
+                self.thread_completed += 1
+    
+    async def run_in_thread(self, func, payload: dict, task_id: int, timeout: float = None):
+        """Run a blocking func(payload, task_id) in the I/O thread pool with a timeout"""
+        timeout = timeout or settings.THREAD_TASK_TIMEOUT
+        loop = asyncio.get_running_loop()
+        self.thread_submitted += 1
+        future = loop.run_in_executor(
+            self.get_thread_pool(), self.call_counted, func, payload, task_id
+        )
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            # The thread can't be interrupted; it keeps its slot until it returns
+            self.thread_timeouts += 1
+            raise TimeoutError(f"Handler timed out after {timeout}s")
+    
+    def stats(self) -> dict:
+        with self.thread_lock:
+            active = self.thread_active
+            completed = self.thread_completed
+        return {
+            "thread_pool": {
+                "size": settings.THREAD_POOL_SIZE,
+                "active": active,
+                "queued": self.thread_submitted - active - completed,
+                "completed": completed,
+                "timeouts": self.thread_timeouts
+            },
+            "process_pool": {
+                "size": settings.PROCESS_POOL_SIZE,
+                "started": self.process_pool is not None
+            }
+        }
+    
+    def shutdown(self):
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=False, cancel_futures=True)
+            self.process_pool = None
+        if self.thread_pool is not None:
+            self.thread_pool.shutdown(wait=False, cancel_futures=True)
+            self.thread_pool = None
@@ -0,0 +1,136 @@
+"""Registry mapping task_type to its handler and execution metadata.
+
+Register a handler with the @handler decorator:
+
+    @handler("email", concurrency=20, timeout=10, max_retries=5)
+    async def send_email(payload: dict, task_id: int) -> dict:
+        ...
+
+Handlers receive the parsed payload and the task id and return a
+JSON-serializable result. mode="process" runs a CPU-heavy handler in the
+process pool and mode="thread" runs one built on blocking client libraries
+(SMTP, file I/O, legacy SDKs) in the I/O thread pool; both must be plain
+module-level functions. @cpu_bound and @blocking_io are shorthands.
+
+A handler registered with batchable=True is called once for up to
+batch_size tasks of its type, gathered for at most batch_wait seconds. It
+receives lists of payloads and task ids and returns a list of results in
+the same order; an exception in place of a result fails just that task.
+
+The built-in handlers are imported before any other handler module.
+Registering a task type that already has a handler raises ValueError unless
+override=True is passed, so replacing a built-in is always explicit.
+
+Handler modules are imported on first use of a task type: from
+HANDLER_MODULES ("task_type:module,..."), or from the
+"task_processing.handlers" entry point group. Types with no handler of
+their own run on the "*" fallback. If a type's module fails to import,
+the lookup raises and its tasks fail; the import is retried on next use.
+"""
+import importlib
+from dataclasses import dataclass
+from importlib.metadata import entry_points
+from typing import Callable, Optional
+
+from app.config import settings
+
+ENTRY_POINT_GROUP = "task_processing.handlers"
+EXECUTION_MODES = ("async", "thread", "process")
+BUILTIN_MODULES = ("app.builtin_handlers",)
+
+@dataclass
+class HandlerSpec:
+    task_type: str
+    func: Callable
+    mode: str = "async"  # "async", "thread" or "process"
+    concurrency: Optional[int] = None  # max tasks of this type running per node
+    timeout: Optional[float] = None  # seconds
+    max_retries: Optional[int] = None  # defaults to MAX_RETRIES
+    retry_backoff: Optional[float] = None  # base backoff, defaults to RETRY_DELAY
+    batchable: bool = False  # handler takes (payloads, task_ids), returns a list of results
+    batch_size: int = 100  # most tasks per handler call
+    batch_wait: float = 0.05  # seconds to wait for a batch to fill
+
+class HandlerRegistry:
+    def __init__(self, modules: dict = None, builtins: tuple = BUILTIN_MODULES):
+        self.specs = {}
+        self.modules = dict(modules or {})
+        self.builtins = builtins
+        self.builtins_loaded = False
+        self.imported = set()  # task types whose module imported successfully
+        self.plugins = None  # entry point name -> entry point
+
+    def register(self, task_type: str, mode: str = "async", override: bool = False, **options):
+        """Decorator registering func as the handler for task_type"""
+        if mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode {mode!r} for {task_type}")
+        if mode == "process" and options.get("batchable"):
+            raise ValueError(f"Batch handlers can't run in the process pool ({task_type})")
+        # Built-ins go first so a user handler can only replace one explicitly
+        self.load_builtins()
+
+        def decorator(func):
+            if task_type in self.specs and not override:
+                raise ValueError(
+                    f"A handler for {task_type} is already registered; pass override=True to replace it"
+                )
+            self.specs[task_type] = HandlerSpec(task_type, func, mode, **options)
+            return func
+        return decorator
+
+    def get(self, task_type: str) -> Optional[HandlerSpec]:
+        """Look up a handler, importing its module on first use"""
+        self.load_builtins()
+        self.load(task_type)
+        spec = self.specs.get(task_type)
+        if spec is None:
+            self.load("*")
+            spec = self.specs.get("*")
+        return spec
+
+    def load_builtins(self):
+        if self.builtins_loaded:
+            return
+        for module in self.builtins:
+            importlib.import_module(module)
+        self.builtins_loaded = True
+
+    def load(self, task_type: str):
+        """Import the module providing task_type, if there is one.
+
+        Only successful imports are remembered, and types with nothing to
+        import are not recorded at all.
+        """
+        if task_type in self.imported:
+            return
+
+        if task_type in self.modules:
+            # Undo a partial import's registrations so a retry can register again
+            registered = dict(self.specs)
+            try:
+                importlib.import_module(self.modules[task_type])
+            except Exception:
+                self.specs = registered
+                raise
+        else:
+            if self.plugins is None:
+                self.plugins = {
+                    entry_point.name: entry_point
+                    for entry_point in entry_points(group=ENTRY_POINT_GROUP)
+                }
+            entry_point = self.plugins.get(task_type)
+            if entry_point is None:
+                return
+            entry_point.load()
+        self.imported.add(task_type)
+
+registry = HandlerRegistry(settings.HANDLER_MODULES)
+handler = registry.register
+
+def cpu_bound(task_type: str, **options):
+    """Run this task type's handler in the process pool"""
+    return registry.register(task_type, mode="process", **options)
+
+def blocking_io(task_type: str, **options):
+    """Run this task type's handler in the blocking I/O thread pool"""
+    return registry.register(task_type, mode="thread", **options)
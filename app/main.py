@@ -1,15 +1,27 @@
+import asyncio
 import time
 from fastapi import Request
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, insert, func, tuple_, any_, literal, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
 from typing import List
+import base64
 import json
-from datetime import datetime, timedelta
+import tempfile
+from datetime import datetime, timedelta, timezone
 
-from app.database import get_db, init_db
-from app.models import Task, TaskStatus
-from app.schemas import TaskCreate, TaskResponse, TaskStatusResponse
+from app.config import settings
+from app.database import get_db, init_db, notify, autocommit_engine
+from app.models import Task, TaskStatus, utc_now
+from app.cache import task_cache
+from app.events import task_events, TERMINAL_STATUSES
+from app.schemas import (
+    TaskCreate, TaskResponse, TaskStatusResponse, TaskBatchResponse,
+    TaskStatusBulkRequest, TaskStatusBulkResponse
+)
 from app.worker import WorkerPool
 
 app = FastAPI(title="Task Processing System", version="1.0.0")
@@ -31,6 +43,20 @@ async def startup_event():
     """Initialize database and start worker pool on startup"""
     global worker_pool
     await init_db()
+    # Hear about task state changes committed by other nodes
+    try:
+        await task_events.start()
+    except Exception as e:
+        # Waiters fall back to their timeout; without evictions from other
+        # nodes the cache could serve stale rows, so it is turned off
+        print(f"Task events unavailable, waits will run to their timeout: {e}")
+        task_cache.disable()
+    
+    # With RUN_WORKERS=false, tasks are run by `python -m app.worker` processes
+    if not settings.RUN_WORKERS:
+        print("✅ Database initialized (workers disabled)")
+        return
+    
     worker_pool = WorkerPool()
     await worker_pool.start()
     print("✅ Database initialized and Worker Pool started")
@@ -40,6 +66,7 @@ async def shutdown_event():
     """Stop worker pool on shutdown"""
     if worker_pool:
         await worker_pool.stop()
+    await task_events.stop()
     print("🛑 Worker Pool stopped")
 
 @app.get("/")
@@ -49,7 +76,13 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "submit_task": "POST /tasks",
+            "submit_tasks": "POST /tasks/batch",
+            "submit_task_stream": "POST /tasks/stream",
             "get_task_status": "GET /tasks/{task_id}",
+            "get_task_state": "GET /tasks/{task_id}/status",
+            "wait_for_task": "GET /tasks/{task_id}/wait",
+            "get_task_statuses": "POST /tasks/status:bulk",
+            "stream_task_events": "GET /tasks/events",
             "get_all_tasks": "GET /tasks",
             "get_task_result": "GET /tasks/{task_id}/result",
             "get_stats": "GET /stats",
@@ -57,66 +90,462 @@ async def root():
         }
     }
 
+def validate_schedule(task_data: TaskCreate):
+    """Reject conflicting or negative scheduling options"""
+    if task_data.run_at and task_data.delay_seconds is not None:
+        raise HTTPException(status_code=400, detail="Use either run_at or delay_seconds, not both")
+    if task_data.delay_seconds is not None and task_data.delay_seconds < 0:
+        raise HTTPException(status_code=400, detail="delay_seconds must not be negative")
+
+def task_values(task_data: TaskCreate) -> dict:
+    """Column values for a new task; future-dated tasks stay SCHEDULED, out of
+    the claim index, until next_run_at. Timestamps and counters come from the
+    column server defaults"""
+    run_at = task_data.scheduled_for()
+    return {
+        "task_type": task_data.task_type,
+        "payload": json.dumps(task_data.payload),
+        "priority": task_data.priority,
+        "next_run_at": run_at,
+        "status": TaskStatus.SCHEDULED if run_at and run_at > datetime.utcnow() else TaskStatus.PENDING
+    }
+
+# Run times per wakeup NOTIFY; each is ~27 bytes, under the 8000-byte payload cap
+RUN_AT_CHUNK = 250
+
+# Everything TaskResponse needs, read back from the INSERT itself
+TASK_RESPONSE_COLUMNS = [getattr(Task, field) for field in TaskResponse.model_fields]
+
 @app.post("/tasks", response_model=TaskResponse, status_code=201)
-async def submit_task(
-    task_data: TaskCreate,
-    db: AsyncSession = Depends(get_db)
-):
-    """Submit a new task to the queue"""
+async def submit_task(task_data: TaskCreate):
+    """Submit a new task to the queue, optionally scheduled for later"""
+    validate_schedule(task_data)
+    
     try:
-        # Create new task
-        new_task = Task(
-            task_type=task_data.task_type,
-            payload=json.dumps(task_data.payload),
-            status=TaskStatus.PENDING
-        )
+        values = task_values(task_data)
+        # A run_at already in the past is claimable straight away
+        run_at = values["next_run_at"] if values["status"] == TaskStatus.SCHEDULED else None
         
-        db.add(new_task)
-        await db.commit()
-        await db.refresh(new_task)
+        # One autocommitted statement: the INSERT returns the response row and
+        # wakes fetchers on every node (delayed tasks carry their run time so
+        # each node can arm a timer instead); no BEGIN/COMMIT or refresh
+        wake = func.pg_notify(settings.NOTIFY_CHANNEL, run_at.isoformat() if run_at else "")
+        async with autocommit_engine.connect() as conn:
+            result = await conn.execute(
+                insert(Task).values(**values).returning(*TASK_RESPONSE_COLUMNS, wake)
+            )
+            new_task = result.mappings().one()
         
         # Notify worker pool about new task
         if worker_pool:
-            await worker_pool.notify_new_task()
+            await worker_pool.notify_new_task(run_at)
         
         return new_task
     
     except Exception as e:
-        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to create task: {str(e)}")
 
+@app.post("/tasks/batch", response_model=TaskBatchResponse, status_code=201)
+async def submit_tasks(
+    tasks: List[TaskCreate],
+    db: AsyncSession = Depends(get_db)
+):
+    """Submit many tasks with multi-row INSERT ... RETURNING; ids come back in order"""
+    if len(tasks) > settings.MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.MAX_BATCH_SIZE} tasks per batch"
+        )
+    for task_data in tasks:
+        validate_schedule(task_data)
+    if not tasks:
+        return {"ids": []}
+    
+    try:
+        ids = await insert_tasks(db, [task_values(task_data) for task_data in tasks])
+        return {"ids": ids}
+    
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to create tasks: {str(e)}")
+
+@app.post("/tasks/stream")
+async def submit_task_stream(
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """Ingest an NDJSON upload of tasks, one TaskCreate per line.
+    
+    Lines are parsed as they arrive and inserted every STREAM_CHUNK_SIZE
+    tasks, so workers start on the first chunk while the upload continues.
+    The response has one NDJSON line per input line: {"line": n, "id": ...}
+    or {"line": n, "error": ...}.
+    """
+    # Outcomes are spooled (to disk past STREAM_SPOOL_SIZE bytes) so memory
+    # stays flat however many lines are uploaded
+    outcomes = tempfile.SpooledTemporaryFile(max_size=settings.STREAM_SPOOL_SIZE)
+    pending = []  # (line number, row or None, error or None)
+    
+    async def flush():
+        rows = [row for _, row, _ in pending if row is not None]
+        ids, error = [], None
+        if rows:
+            try:
+                ids = await insert_tasks(db, rows)
+            except Exception as e:
+                await db.rollback()
+                error = f"Failed to create task: {str(e)}"
+        ids = iter(ids)
+        for line_number, row, line_error in pending:
+            if row is None or error:
+                outcome = {"line": line_number, "error": line_error or error}
+            else:
+                outcome = {"line": line_number, "id": next(ids)}
+            outcomes.write(json.dumps(outcome).encode() + b"\n")
+        pending.clear()
+    
+    def parse(line_number: int, line: bytes):
+        if not line.strip():
+            return
+        try:
+            task_data = TaskCreate.model_validate_json(line)
+            validate_schedule(task_data)
+            pending.append((line_number, task_values(task_data), None))
+        except HTTPException as e:
+            pending.append((line_number, None, e.detail))
+        except Exception as e:
+            pending.append((line_number, None, str(e)))
+    
+    too_long = f"Line longer than {settings.STREAM_MAX_LINE} bytes"
+    line_number = 0
+    buffer = bytearray()  # the line in progress, never over STREAM_MAX_LINE
+    oversized = False  # skipping the rest of a line that is too long
+    async for chunk in request.stream():
+        # Only the new chunk is split, so each byte is scanned once
+        *ends, rest = chunk.split(b"\n")
+        for end in ends:
+            line_number += 1
+            if oversized or len(buffer) + len(end) > settings.STREAM_MAX_LINE:
+                pending.append((line_number, None, too_long))
+            else:
+                buffer += end
+                parse(line_number, bytes(buffer))
+            buffer.clear()
+            oversized = False
+        if not oversized and len(buffer) + len(rest) > settings.STREAM_MAX_LINE:
+            oversized = True
+            buffer.clear()
+        elif not oversized:
+            buffer += rest
+        if len(pending) >= settings.STREAM_CHUNK_SIZE:
+            await flush()
+    if oversized:
+        pending.append((line_number + 1, None, too_long))
+    elif buffer:
+        parse(line_number + 1, bytes(buffer))
+    await flush()
+    
+    outcomes.seek(0)
+    
+    def read_outcomes():
+        try:
+            while chunk := outcomes.read(65536):
+                yield chunk
+        finally:
+            outcomes.close()
+    
+    return StreamingResponse(read_outcomes(), media_type="application/x-ndjson")
+
+async def insert_tasks(db: AsyncSession, rows: list) -> list:
+    """Insert task rows with multi-row INSERT ... RETURNING, commit, and wake
+    the workers once; returns the new ids in row order"""
+    # SQLAlchemy packs the rows into multi-row INSERTs and keeps the
+    # RETURNING ids in parameter order
+    result = await db.execute(
+        insert(Task).returning(Task.id, sort_by_parameter_order=True),
+        rows
+    )
+    ids = result.scalars().all()
+    
+    # Wake fetchers once for the whole batch
+    scheduled = [row["next_run_at"] for row in rows if row["status"] == TaskStatus.SCHEDULED]
+    if len(scheduled) < len(rows):
+        await notify(db, settings.NOTIFY_CHANNEL)
+    # Every distinct run time a node may already have loaded gets its own
+    # timer there; later ones are picked up by each node's loader
+    window_end = datetime.utcnow() + timedelta(seconds=2 * settings.TIMER_HORIZON)
+    run_ats = sorted({run_at for run_at in scheduled if run_at <= window_end})
+    for start in range(0, len(run_ats), RUN_AT_CHUNK):
+        chunk = run_ats[start:start + RUN_AT_CHUNK]
+        await notify(db, settings.NOTIFY_CHANNEL, ",".join(run_at.isoformat() for run_at in chunk))
+    await db.commit()
+    
+    if worker_pool:
+        if len(scheduled) < len(rows):
+            await worker_pool.notify_new_task()
+        for run_at in run_ats:
+            await worker_pool.notify_new_task(run_at)
+    
+    return ids
+
+def parse_fields(fields: str) -> list:
+    """Validate a comma-separated `fields=` list against TaskResponse"""
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in TaskResponse.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    if not names:
+        raise HTTPException(status_code=400, detail="fields must name at least one field")
+    return names
+
+def sparse(row, names: list) -> dict:
+    return {name: getattr(row, name) for name in names}
+
+def sparse_dict(task: dict, names: list) -> dict:
+    return {name: task[name] for name in names}
+
+def parse_ids(ids: str) -> set:
+    try:
+        return {int(task_id) for task_id in ids.split(",") if task_id.strip()}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+
+@app.get("/tasks/events")
+async def stream_task_events(ids: str = None, task_type: str = None):
+    """Server-Sent Events stream of state changes for ids and/or task_type"""
+    task_ids = parse_ids(ids) if ids else set()
+    
+    async def events():
+        with task_events.subscribe(task_ids, task_type) as subscription:
+            yield ": subscribed\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=settings.EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    yield "event: lagged\ndata: {}\n\n"
+                    return
+                yield f"event: {event['status']}\ndata: {json.dumps(event)}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/tasks/{task_id}", response_model=TaskResponse)
 async def get_task_status(
     task_id: int,
+    fields: str = None,
     db: AsyncSession = Depends(get_db)
 ):
-    """Get status of a specific task"""
+    """Get a specific task; `fields=status,retry_count` returns only those fields"""
+    cached = task_cache.get(task_id)
+    if cached is not None:
+        if fields:
+            return JSONResponse(jsonable_encoder(sparse_dict(cached, parse_fields(fields))))
+        return cached
+    
+    if fields:
+        # Read just the requested columns, so the payload and result blobs
+        # are not fetched unless asked for
+        names = parse_fields(fields)
+        result = await db.execute(
+            select(*[getattr(Task, name) for name in names]).where(Task.id == task_id)
+        )
+        row = result.one_or_none()
+        if not row:
+            raise HTTPException(status_code=404, detail="Task not found")
+        return JSONResponse(jsonable_encoder(sparse(row, names)))
+    
     result = await db.execute(select(Task).where(Task.id == task_id))
     task = result.scalar_one_or_none()
     
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
+    task_cache.remember(task)
+    return task
+
+@app.get(
+    "/tasks/{task_id}/status",
+    response_model=TaskStatusResponse,
+    response_model_exclude_unset=True
+)
+async def get_task_state(
+    task_id: int,
+    include_result: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """Lightweight status check for polling clients; the result blob is
+    only read with include_result=true"""
+    columns = [Task.id, Task.status, Task.error_message]
+    if include_result:
+        columns.append(Task.result)
+    
+    cached = task_cache.get(task_id)
+    if cached is not None:
+        return {column.key: cached[column.key] for column in columns}
+    
+    result = await db.execute(select(*columns).where(Task.id == task_id))
+    row = result.one_or_none()
+    
+    if not row:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    return row._mapping
+
+# updated_at is stamped from the database clock when a transaction starts,
+# a moment before it commits; as_of trails the read by this much so a
+# change committing meanwhile is not skipped
+STATUS_SINCE_OVERLAP = timedelta(seconds=5)
+
+@app.post(
+    "/tasks/status:bulk",
+    response_model=TaskStatusBulkResponse,
+    response_model_exclude_unset=True
+)
+async def get_task_statuses(
+    request: TaskStatusBulkRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """Status of many tasks in one query; with `since`, only those changed since then"""
+    if len(request.ids) > settings.MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.MAX_BATCH_SIZE} ids per request"
+        )
+    
+    columns = [Task.id, Task.status, Task.error_message]
+    if request.include_result:
+        columns.append(Task.result)
+    # One array parameter, so the statement is the same for any number of ids
+    query = select(*columns).where(Task.id == any_(literal(request.ids, ARRAY(Integer))))
+    if request.since:
+        query = query.where(Task.updated_at >= naive_utc(request.since))
+    
+    # as_of comes from the same clock that stamps updated_at
+    as_of = (await db.execute(select(utc_now()))).scalar() - STATUS_SINCE_OVERLAP
+    result = await db.execute(query)
+    return {"tasks": [row._mapping for row in result], "as_of": as_of}
+
+@app.get("/tasks/{task_id}/wait", response_model=TaskResponse)
+async def wait_for_task(
+    task_id: int,
+    timeout: float = Query(30, ge=0, le=settings.WAIT_MAX_TIMEOUT),
+    db: AsyncSession = Depends(get_db)
+):
+    """Long-poll: return the task once it completes or fails, or as it
+    stands when timeout seconds pass"""
+    cached = task_cache.get(task_id)
+    if cached is not None:
+        return cached
+    
+    with task_events.waiter(task_id) as finished:
+        result = await db.execute(select(Task).where(Task.id == task_id))
+        task = result.scalar_one_or_none()
+        
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        if task.status in TERMINAL_STATUSES:
+            task_cache.remember(task)
+            return task
+        
+        # Don't hold a pooled connection while waiting
+        await db.close()
+        try:
+            await asyncio.wait_for(finished.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return task
+    
+    # A task finished by this node's workers is already cached
+    cached = task_cache.get(task_id)
+    if cached is not None:
+        return cached
+    
+    result = await db.execute(select(Task).where(Task.id == task_id))
+    task = result.scalar_one_or_none()
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    task_cache.remember(task)
     return task
 
+def encode_cursor(task) -> str:
+    """Opaque token for the (created_at, id) position after a task"""
+    position = json.dumps([task.created_at.isoformat(), task.id])
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        created_at, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(task_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def naive_utc(value: datetime) -> datetime:
+    """Match the naive UTC datetimes stored in the tasks table"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
 @app.get("/tasks", response_model=List[TaskResponse])
 async def get_all_tasks(
+    response: Response,
     status: TaskStatus = None,
-    limit: int = 100,
+    task_type: str = None,
+    created_after: datetime = None,
+    created_before: datetime = None,
+    cursor: str = None,
+    limit: int = Query(100, ge=1, le=1000),
+    fields: str = None,
     db: AsyncSession = Depends(get_db)
 ):
-    """Get all tasks, optionally filtered by status"""
-    query = select(Task)
+    """List tasks newest first, one page at a time.
+
+    Pass the X-Next-Cursor response header back as `cursor` for the next page;
+    it is absent on the last page. `fields=` limits each task to those fields
+    """
+    names = parse_fields(fields) if fields else None
+    if names:
+        # created_at and id are always read to build the next cursor
+        columns = dict.fromkeys(names + ["created_at", "id"])
+        query = select(*[getattr(Task, name) for name in columns])
+    else:
+        query = select(Task)
     
     if status:
         query = query.where(Task.status == status)
+    if task_type:
+        query = query.where(Task.task_type == task_type)
+    if created_after:
+        query = query.where(Task.created_at >= naive_utc(created_after))
+    if created_before:
+        query = query.where(Task.created_at < naive_utc(created_before))
+    if cursor:
+        # Keyset: resume strictly after the last row sent, so every page is
+        # an index range scan no matter how deep it is
+        query = query.where(tuple_(Task.created_at, Task.id) < decode_cursor(cursor))
     
-    query = query.limit(limit).order_by(Task.created_at.desc())
+    # One extra row tells us whether another page exists
+    query = query.order_by(Task.created_at.desc(), Task.id.desc()).limit(limit + 1)
     
     result = await db.execute(query)
-    tasks = result.scalars().all()
+    tasks = result.all() if names else result.scalars().all()
+    
+    next_cursor = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        next_cursor = encode_cursor(tasks[-1])
+    
+    if names:
+        # Returned as-is: a partial task would not validate as TaskResponse
+        response = JSONResponse(jsonable_encoder([sparse(row, names) for row in tasks]))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
-    return tasks
+    return response if names else tasks
 
 @app.get("/tasks/{task_id}/result")
 async def get_task_result(
@@ -124,13 +553,29 @@ async def get_task_result(
     db: AsyncSession = Depends(get_db)
 ):
     """Get the result of a completed task"""
+    cached = task_cache.get(task_id)
+    if cached is not None:
+        if cached["status"] == TaskStatus.FAILED:
+            return {
+                "status": cached["status"].value,
+                "error": cached["error_message"],
+                "retry_count": cached["retry_count"]
+            }
+        return {
+            "status": cached["status"].value,
+            "result": task_cache.result(task_id),
+            "completed_at": cached["completed_at"]
+        }
+    
     result = await db.execute(select(Task).where(Task.id == task_id))
     task = result.scalar_one_or_none()
     
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    if task.status == TaskStatus.PENDING or task.status == TaskStatus.PROCESSING:
+    task_cache.remember(task)
+    
+    if task.status in [TaskStatus.PENDING, TaskStatus.SCHEDULED, TaskStatus.PROCESSING]:
         return {
             "status": task.status.value,
             "message": "Task is still processing"
@@ -224,8 +669,14 @@ async def get_detailed_stats(db: AsyncSession = Depends(get_db)):
         },
         "worker_pool": {
             "pool_size": worker_pool.pool_size if worker_pool else 0,
-            "active_workers": len(worker_pool.workers) if worker_pool else 0
-        }
+            "active_workers": len(worker_pool.workers) if worker_pool else 0,
+            "queued_tasks": worker_pool.task_queue.qsize() if worker_pool else 0,
+            "in_flight_tasks": len(worker_pool.in_flight) if worker_pool else 0,
+            "lanes": worker_pool.task_queue.stats() if worker_pool else {},
+            "executors": worker_pool.executors.stats() if worker_pool else {},
+            "autoscaling": worker_pool.autoscale_stats() if worker_pool else {}
+        },
+        "task_cache": task_cache.stats()
     }
 
 @app.delete("/tasks/{task_id}")
@@ -240,13 +691,16 @@ async def delete_task(
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    if task.status in [TaskStatus.PENDING, TaskStatus.PROCESSING]:
+    if task.status in [TaskStatus.PENDING, TaskStatus.SCHEDULED, TaskStatus.PROCESSING]:
         raise HTTPException(
             status_code=400, 
-            detail="Cannot delete task that is pending or processing"
+            detail="Cannot delete task that is pending, scheduled or processing"
         )
     
     await db.delete(task)
+    # Drop the task from every node's cache
+    await task_events.announce_deleted(db, [task_id])
     await db.commit()
+    task_cache.evict(task_id)
     
     return {"message": f"Task {task_id} deleted successfully"}
\ No newline at end of file
@@ -1,5 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Enum
-from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, Text, Enum, Index, text, literal_column, func
 import enum
 from app.database import Base
 
@@ -9,6 +8,15 @@ class TaskStatus(enum.Enum):
     COMPLETED = "completed"
     FAILED = "failed"
     RETRYING = "retrying"
+    SCHEDULED = "scheduled"
+
+# Filled in by Postgres so an INSERT ... RETURNING yields the full row
+UTC_NOW = text("(now() at time zone 'utc')")
+
+def utc_now():
+    """The database clock as naive UTC. updated_at is always stamped from
+    it, so clients can compare it with the server's as_of across hosts"""
+    return func.timezone("utc", func.now())
 
 class Task(Base):
     __tablename__ = "tasks"
@@ -16,10 +24,47 @@ class Task(Base):
     id = Column(Integer, primary_key=True, index=True)
     task_type = Column(String(50), nullable=False)
     payload = Column(Text, nullable=False)  # JSON string
-    status = Column(Enum(TaskStatus), default=TaskStatus.PENDING, nullable=False)
+    status = Column(Enum(TaskStatus), default=TaskStatus.PENDING, server_default=TaskStatus.PENDING.name, nullable=False)
+    priority = Column(Integer, default=0, server_default="0", nullable=False)  # higher runs first
     result = Column(Text, nullable=True)
     error_message = Column(Text, nullable=True)
-    retry_count = Column(Integer, default=0)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    completed_at = Column(DateTime, nullable=True)
\ No newline at end of file
+    retry_count = Column(Integer, default=0, server_default="0")
+    next_run_at = Column(DateTime, nullable=True)  # earliest time a scheduled task or retry may be claimed
+    lease_expires_at = Column(DateTime, nullable=True, index=True)  # renewed by worker heartbeats
+    lease_token = Column(String(32), nullable=True)  # set by each claim; only its holder may write
+    created_at = Column(DateTime, server_default=UTC_NOW)
+    updated_at = Column(DateTime, server_default=UTC_NOW, onupdate=utc_now())
+    completed_at = Column(DateTime, nullable=True)
+
+# SCHEDULED tasks and RETRYING tasks in backoff wait for next_run_at and are
+# then promoted to PENDING, so only tasks that may run now are claimable
+WAITING_STATUSES = (TaskStatus.SCHEDULED, TaskStatus.RETRYING)
+
+def status_in(statuses):
+    """status IN (...) with the names inlined rather than bound, so the
+    planner matches the partial indexes below in generic plans too"""
+    return Task.status.in_([literal_column(f"'{status.name}'") for status in statuses])
+
+def claimable_status():
+    return status_in((TaskStatus.PENDING,))
+
+def waiting_status():
+    return status_in(WAITING_STATUSES)
+
+def waiting_since():
+    """When a task became claimable: at creation, or when its schedule or
+    retry backoff ended (next_run_at is kept when it is promoted)"""
+    return func.coalesce(Task.next_run_at, Task.created_at)
+
+# Backs the claim order over claimable rows only: highest priority first,
+# oldest first within a priority
+Index("ix_tasks_claimable", Task.priority.desc(), Task.created_at, postgresql_where=claimable_status())
+# Backs the autoscaler's backlog count and oldest-waiting-task lookup
+Index("ix_tasks_claimable_since", waiting_since(), postgresql_where=claimable_status())
+# Backs promotion and the timer loader: only rows still waiting, by due time
+Index("ix_tasks_waiting_until", Task.next_run_at, postgresql_where=waiting_status())
+
+# Back the newest-first keyset pages of GET /tasks, alone or filtered
+Index("ix_tasks_created", Task.created_at, Task.id)
+Index("ix_tasks_status_created", Task.status, Task.created_at, Task.id)
+Index("ix_tasks_type_created", Task.task_type, Task.created_at, Task.id)
@@ -0,0 +1,238 @@
+import asyncio
+import math
+from collections import deque
+
+
+class LaneScheduler:
+    """Per-task_type lanes served by deficit round robin.
+
+    Each lane earns its weight in credit per round and spends one credit per
+    task handed out, so a lane with weight 4 gets four tasks for every one
+    from a lane with weight 1 while both have work. Lanes with a concurrency
+    cap are skipped while that many of their tasks are running. A lane is
+    dropped once it has nothing queued or running, so the scheduler only
+    tracks task types that are live right now.
+    """
+
+    def __init__(self, maxsize: int, weights: dict = None, limits: dict = None):
+        self.maxsize = maxsize
+        self.weights = weights or {}
+        self.configured_limits = dict(limits or {})
+        self.limits = dict(self.configured_limits)  # plus limits set per lane while it exists
+        self.lanes = {}
+        self.deficit = {}
+        self.running = {}
+        self.order = []
+        self.cursor = 0
+        self.size = 0
+        self.changed = asyncio.Condition()
+
+    def qsize(self) -> int:
+        return self.size
+
+    def weight(self, task_type: str) -> float:
+        return max(self.weights.get(task_type, 1), 0.01)
+
+    def limit(self, task_type: str):
+        return self.limits.get(task_type)
+
+    def saturated_lanes(self) -> list:
+        """Capped lanes that already buffer enough work to fill their cap"""
+        return [
+            task_type for task_type in self.order
+            if self.limit(task_type) is not None
+            and len(self.lanes[task_type]) + self.running[task_type] >= self.limit(task_type)
+        ]
+
+    def _lane(self, task_type: str) -> deque:
+        if task_type not in self.lanes:
+            self.lanes[task_type] = deque()
+            self.deficit[task_type] = 0
+            self.running[task_type] = 0
+            self.order.append(task_type)
+        return self.lanes[task_type]
+
+    def _drop_if_idle(self, task_type: str):
+        if task_type not in self.lanes or self.lanes[task_type] or self.running[task_type]:
+            return
+        index = self.order.index(task_type)
+        del self.order[index]
+        del self.lanes[task_type]
+        del self.deficit[task_type]
+        del self.running[task_type]
+        if task_type not in self.configured_limits:
+            self.limits.pop(task_type, None)
+
+        if index < self.cursor:
+            self.cursor -= 1
+        if self.cursor >= len(self.order):
+            self.cursor = 0
+        elif index == self.cursor:
+            # The next lane moved under the cursor without its quantum
+            next_type = self.order[self.cursor]
+            self.deficit[next_type] += self.weight(next_type)
+
+    def _eligible(self, task_type: str) -> bool:
+        limit = self.limit(task_type)
+        if limit is not None and self.running[task_type] >= limit:
+            return False
+        return bool(self.lanes[task_type])
+
+    def _pick(self):
+        if not any(self._eligible(task_type) for task_type in self.order):
+            return None
+
+        while True:
+            task_type = self.order[self.cursor]
+            if self._eligible(task_type) and self.deficit[task_type] >= 1:
+                self.deficit[task_type] -= 1
+                self.running[task_type] += 1
+                self.size -= 1
+                return self.lanes[task_type].popleft()
+
+            # Idle or capped lanes do not bank credit for later bursts
+            if not self._eligible(task_type):
+                self.deficit[task_type] = 0
+
+            self.cursor = (self.cursor + 1) % len(self.order)
+            next_type = self.order[self.cursor]
+            self.deficit[next_type] += self.weight(next_type)
+
+    async def put(self, task):
+        async with self.changed:
+            self._lane(task.task_type).append(task)
+            self.size += 1
+            # Wake everyone: a batch gatherer may be waiting on another lane
+            self.changed.notify_all()
+
+    async def get(self):
+        """Wait for the next task the fair schedule allows to run"""
+        async with self.changed:
+            while True:
+                task = self._pick()
+                if task is not None:
+                    return task
+                await self.changed.wait()
+
+    def take(self, task_type: str, count: int) -> list:
+        """Pop up to count buffered tasks of one type, bypassing the schedule"""
+        lane = self.lanes.get(task_type)
+        tasks = []
+        while lane and len(tasks) < count:
+            tasks.append(lane.popleft())
+        self.size -= len(tasks)
+        return tasks
+
+    async def take_within(self, task_type: str, count: int, timeout: float) -> list:
+        """Collect up to count tasks of one type as they arrive, for at most timeout seconds"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        tasks = []
+        async with self.changed:
+            while True:
+                tasks += self.take(task_type, count - len(tasks))
+                remaining = deadline - loop.time()
+                if len(tasks) >= count or remaining <= 0:
+                    return tasks
+                try:
+                    await asyncio.wait_for(self.changed.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self, task_type: str):
+        """Mark a task from this lane as finished, freeing a capped slot"""
+        async with self.changed:
+            self.running[task_type] -= 1
+            self._drop_if_idle(task_type)
+            self.changed.notify_all()
+
+    def drain(self) -> list:
+        """Remove and return every buffered task"""
+        tasks = [task for task_type in self.order for task in self.lanes[task_type]]
+        for lane in self.lanes.values():
+            lane.clear()
+        for task_type in list(self.order):
+            self._drop_if_idle(task_type)
+        self.size = 0
+        return tasks
+
+    def stats(self) -> dict:
+        return {
+            task_type: {
+                "queued": len(self.lanes[task_type]),
+                "running": self.running[task_type],
+                "weight": self.weight(task_type),
+                "limit": self.limit(task_type)
+            }
+            for task_type in self.order
+        }
+
+
+class TimingWheel:
+    """Hierarchical timing wheel for future-dated wakeups.
+
+    Adding a timer is O(1) and each tick only empties one bucket; timers far
+    in the future sit in coarser levels and cascade down as they approach.
+    Times are absolute seconds on the monotonic clock.
+    """
+
+    def __init__(self, tick: float, slot_bits: int = 6, levels: int = 4, now: float = 0.0):
+        self.tick = tick
+        self.slot_bits = slot_bits
+        self.mask = (1 << slot_bits) - 1
+        self.levels = levels
+        self.wheels = [[[] for _ in range(1 << slot_bits)] for _ in range(levels)]
+        self.overflow = []
+        self.current = int(now / tick)
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, key, due: float):
+        expires = max(self.current + 1, math.ceil(due / self.tick))
+        self._place(key, expires)
+        self.count += 1
+
+    def _place(self, key, expires: int):
+        delta = expires - self.current
+        for level in range(self.levels):
+            if delta < 1 << (self.slot_bits * (level + 1)):
+                index = (expires >> (self.slot_bits * level)) & self.mask
+                self.wheels[level][index].append((key, expires))
+                return
+        self.overflow.append((key, expires))
+
+    def _cascade(self, level: int):
+        index = (self.current >> (self.slot_bits * level)) & self.mask
+        bucket = self.wheels[level][index]
+        self.wheels[level][index] = []
+        for key, expires in bucket:
+            self._place(key, expires)
+        return index
+
+    def advance(self, now: float) -> list:
+        """Move the wheel up to `now` and return the keys that fell due"""
+        target = int(now / self.tick)
+        due = []
+        while self.current < target:
+            self.current += 1
+
+            # When a level wraps, pull the next bucket of the level above down
+            level = 1
+            while level < self.levels and (self.current >> (self.slot_bits * (level - 1))) & self.mask == 0:
+                if self._cascade(level) != 0:
+                    break
+                level += 1
+            else:
+                if level == self.levels and self.overflow:
+                    overflow, self.overflow = self.overflow, []
+                    for key, expires in overflow:
+                        self._place(key, expires)
+
+            bucket = self.wheels[0][self.current & self.mask]
+            if bucket:
+                self.wheels[0][self.current & self.mask] = []
+                due.extend(key for key, _ in bucket)
+                self.count -= len(bucket)
+        return due
@@ -1,20 +1,33 @@
 from pydantic import BaseModel
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 from app.models import TaskStatus
 
 class TaskCreate(BaseModel):
     task_type: str
     payload: dict
+    priority: int = 0
+    run_at: Optional[datetime] = None  # schedule for a specific time...
+    delay_seconds: Optional[float] = None  # ...or for a delay from now
+    
+    def scheduled_for(self) -> Optional[datetime]:
+        """Resolve run_at / delay_seconds to a naive UTC datetime"""
+        if self.delay_seconds is not None:
+            return datetime.utcnow() + timedelta(seconds=self.delay_seconds)
+        if self.run_at is not None and self.run_at.tzinfo is not None:
+            return self.run_at.astimezone(timezone.utc).replace(tzinfo=None)
+        return self.run_at
 
 class TaskResponse(BaseModel):
     id: int
     task_type: str
     payload: str
     status: TaskStatus
+    priority: int = 0
     result: Optional[str] = None
     error_message: Optional[str] = None
     retry_count: int
+    next_run_at: Optional[datetime] = None
     created_at: datetime
     updated_at: datetime
     completed_at: Optional[datetime] = None
@@ -22,8 +35,20 @@ class TaskResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class TaskBatchResponse(BaseModel):
+    ids: List[int]  # in submission order
+
 class TaskStatusResponse(BaseModel):
     id: int
     status: TaskStatus
     result: Optional[str] = None
     error_message: Optional[str] = None
+
+class TaskStatusBulkRequest(BaseModel):
+    ids: List[int]
+    since: Optional[datetime] = None  # only tasks updated at or after this (pass back as_of)
+    include_result: bool = False  # results can be large; left out unless asked for
+
+class TaskStatusBulkResponse(BaseModel):
+    tasks: List[TaskStatusResponse]
+    as_of: datetime  # send as `since` on the next call to get only changes
@@ -1,37 +1,109 @@
+import argparse
 import asyncio
 import json
-from datetime import datetime
-from sqlalchemy import select
+import math
+import random
+import signal
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, func, or_, and_, cast, case, tuple_, Integer, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import async_session_maker
-from app.models import Task, TaskStatus
+from app.database import async_session_maker, engine, init_db, listen, notify
+from app.cache import task_cache
+from app.events import task_events
+from app.models import Task, TaskStatus, claimable_status, waiting_status, waiting_since, utc_now
 from app.config import settings
+from app.executors import HandlerExecutors
+from app.handlers import registry
+from app.scheduler import LaneScheduler, TimingWheel
+from app.writer import CompletionWriter
+
+# application_name of each worker node's LISTEN connection
+WORKER_APPLICATION_NAME = "task-worker"
 
 class WorkerPool:
-    def __init__(self):
-        self.pool_size = settings.WORKER_POOL_SIZE
+    def __init__(self, pool_size: int = None):
+        self.pool_size = pool_size or settings.WORKER_POOL_SIZE
+        # Autoscaling bounds; both default to the starting size (no scaling)
+        self.min_size = settings.WORKER_POOL_MIN or self.pool_size
+        self.max_size = max(settings.WORKER_POOL_MAX or self.pool_size, self.min_size)
+        self.pool_size = min(max(self.pool_size, self.min_size), self.max_size)
         self.workers = []
+        self.worker_ids = []  # ids of live workers, oldest first
+        self.next_worker_id = 0
+        self.retiring = set()  # worker ids asked to exit after their current task
+        self.task_latency = 0.0  # worker-seconds per task, smoothed
+        self.scaling_decisions = deque(maxlen=20)
+        self.background_tasks = []  # fetcher, ager, timers, heartbeat, reaper, autoscaler
         self.running = False
-        self.task_queue = asyncio.Queue()
+        # Bounded local buffer, split into fairly scheduled per-type lanes;
+        # the fetcher stops claiming while it is full
+        self.task_queue = LaneScheduler(
+            maxsize=settings.PREFETCH_LIMIT,
+            weights=settings.LANE_WEIGHTS,
+            limits=settings.LANE_CONCURRENCY
+        )
+        self.space_available = asyncio.Event()
+        self.busy_workers = 0
+        self.completed_since_check = 0
+        self.drain_rate = 0.0  # tasks/second, smoothed
+        self.rate_checked_at = time.monotonic()
+        self.in_flight = {}  # id -> lease_token of tasks claimed by this pool: queued or running
+        self.wakeup = asyncio.Event()
+        self.listener = None
+        # Wakes the fetcher when delayed tasks and retries fall due
+        self.timers = TimingWheel(tick=settings.TIMER_TICK, now=time.monotonic())
+        self.timers_loaded_until = datetime.utcnow()
+        self.timers_next_load = 0.0  # monotonic time of the next load_upcoming_tasks
+        self.executors = HandlerExecutors()
+        # Single writer that batches task outcomes into bulk UPDATEs
+        self.writer = CompletionWriter()
         
     async def start(self):
         """Start all workers in the pool"""
         self.running = True
-        for i in range(self.pool_size):
-            worker = asyncio.create_task(self.worker(i))
-            self.workers.append(worker)
+        self.writer.start()
+        self.add_workers(self.pool_size)
+        
+        # Wake the fetcher on NOTIFY from any node; polling covers missed ones
+        try:
+            # Named so measure_backlog can count the worker nodes sharing the table
+            self.listener = await listen(
+                settings.NOTIFY_CHANNEL, self.on_notify, WORKER_APPLICATION_NAME,
+                on_reconnect=self.on_listener_reconnect
+            )
+        except Exception as e:
+            print(f"LISTEN unavailable, falling back to polling: {e}")
         
-        # Start task fetcher
-        self.task_fetcher = asyncio.create_task(self.fetch_pending_tasks())
+        # Start task fetcher and housekeeping loops
+        for loop in (
+            self.fetch_pending_tasks,
+            self.age_pending_tasks,
+            self.run_timers,
+            self.renew_leases,
+            self.reap_expired_leases,
+            self.autoscale
+        ):
+            self.background_tasks.append(asyncio.create_task(loop()))
         
     async def stop(self):
         """Stop all workers gracefully"""
         self.running = False
         
-        # Cancel task fetcher
-        if hasattr(self, 'task_fetcher'):
-            self.task_fetcher.cancel()
+        # Cancel task fetcher and housekeeping loops
+        for task in self.background_tasks:
+            task.cancel()
+        await asyncio.gather(*self.background_tasks, return_exceptions=True)
+        
+        if self.listener:
+            await self.listener.close()
+        
+        # Hand back claimed tasks no worker has started, so other nodes can
+        # run them now instead of after their leases expire
+        await self.release_queued_tasks()
         
         # Cancel all workers
         for worker in self.workers:
@@ -39,23 +111,152 @@ class WorkerPool:
         
         # Wait for cancellation
         await asyncio.gather(*self.workers, return_exceptions=True)
+        await self.writer.stop()
+        self.executors.shutdown()
+        
+    def add_workers(self, count: int):
+        for _ in range(count):
+            worker = asyncio.create_task(self.worker(self.next_worker_id))
+            self.worker_ids.append(self.next_worker_id)
+            self.next_worker_id += 1
+            self.workers.append(worker)
+    
+    def resize(self, size: int, reason: str, **signals):
+        """Grow or shrink the pool to size workers and record why"""
+        if size == self.pool_size:
+            return
+        
+        print(f"Scaling worker pool {self.pool_size} -> {size}: {reason}")
+        self.scaling_decisions.append({
+            "at": datetime.utcnow().isoformat(),
+            "from": self.pool_size,
+            "to": size,
+            "reason": reason,
+            **signals
+        })
         
+        if size > self.pool_size:
+            self.add_workers(size - self.pool_size)
+        else:
+            # Retire the newest workers; each exits once its current task is done
+            candidates = [i for i in reversed(self.worker_ids) if i not in self.retiring]
+            self.retiring.update(candidates[:self.pool_size - size])
+        self.pool_size = size
+    
+    async def autoscale(self):
+        """Resize the pool from backlog, oldest-task age and handler latency"""
+        if self.min_size == self.max_size:
+            return
+        
+        low_checks = 0
+        while self.running:
+            try:
+                await asyncio.sleep(settings.AUTOSCALE_INTERVAL)
+                self.update_drain_rate()
+                backlog, oldest_age = await self.measure_backlog()
+                
+                # Little's law: workers kept busy by the current throughput,
+                # plus enough to clear the backlog within the target latency
+                latency = self.task_latency
+                desired = math.ceil(
+                    self.drain_rate * latency
+                    + backlog * latency / settings.AUTOSCALE_TARGET_LATENCY
+                )
+                step = max(1, self.pool_size // 4)
+                if oldest_age > settings.AUTOSCALE_TARGET_LATENCY:
+                    desired = max(desired, self.pool_size + step)
+                desired = min(max(desired, self.min_size), self.max_size)
+                signals = {
+                    "backlog": backlog,
+                    "oldest_task_age_seconds": round(oldest_age, 2),
+                    "task_latency_seconds": round(latency, 3),
+                    "drain_rate": round(self.drain_rate, 2)
+                }
+                
+                # Hysteresis: grow at once, shrink only after several checks
+                # in a row say the pool is clearly too big, and then gradually
+                if desired > self.pool_size:
+                    low_checks = 0
+                    self.resize(desired, "backlog growing", **signals)
+                elif desired < self.pool_size * settings.AUTOSCALE_SHRINK_RATIO:
+                    low_checks += 1
+                    if low_checks >= settings.AUTOSCALE_SHRINK_CHECKS:
+                        low_checks = 0
+                        self.resize(max(desired, self.pool_size - step), "pool underused", **signals)
+                else:
+                    low_checks = 0
+                
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                print(f"Error autoscaling: {e}")
+    
+    async def measure_backlog(self):
+        """This node's share of the claimable tasks (counted up to a cap) and
+        how long the longest-waiting one has been claimable"""
+        now = datetime.utcnow()
+        async with async_session_maker() as session:
+            sample = select(Task.id).where(claimable_status()).limit(settings.AUTOSCALE_BACKLOG_CAP).subquery()
+            backlog = (await session.execute(select(func.count()).select_from(sample))).scalar()
+            oldest = (await session.execute(select(func.min(waiting_since())).where(claimable_status()))).scalar()
+            # Every node drains the same table; size this one for its share
+            nodes = (await session.execute(
+                select(func.count()).select_from(text("pg_stat_activity")).where(
+                    text("application_name = :name AND datname = current_database()")
+                ),
+                {"name": WORKER_APPLICATION_NAME}
+            )).scalar()
+        oldest_age = (now - oldest).total_seconds() if oldest else 0.0
+        return math.ceil(backlog / max(nodes, 1)), max(oldest_age, 0.0)
+    
+    def autoscale_stats(self) -> dict:
+        return {
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "task_latency_seconds": round(self.task_latency, 3),
+            "drain_rate": round(self.drain_rate, 2),
+            "recent_decisions": list(self.scaling_decisions)
+        }
+    
     async def fetch_pending_tasks(self):
-        """Continuously fetch pending tasks from database"""
+        """Continuously claim pending tasks from database"""
         while self.running:
             try:
+                # Clear before claiming so a NOTIFY during the claim is not lost
+                self.wakeup.clear()
+                self.space_available.clear()
+                self.update_drain_rate()
+                limit = self.next_batch_size()
+                
+                # Backpressure: leave the rows for other nodes until our
+                # workers drain the buffer
+                if limit == 0:
+                    await self.wait_for(self.space_available)
+                    continue
+                
+                # Don't claim more of a type whose lane is already at its cap
+                saturated = self.task_queue.saturated_lanes()
+                
                 async with async_session_maker() as session:
-                    result = await session.execute(
-                        select(Task)
-                        .where(Task.status == TaskStatus.PENDING)
-                        .limit(self.pool_size * 2)
-                    )
-                    tasks = result.scalars().all()
-                    
-                    for task in tasks:
-                        await self.task_queue.put(task.id)
+                    tasks = await self.claim_tasks(session, limit, exclude_types=saturated)
                 
-                await asyncio.sleep(1)  # Check every second
+                for task in tasks:
+                    # Never hand the same task to two local workers
+                    if task.id in self.in_flight:
+                        continue
+                    self.apply_handler_limits(task.task_type)
+                    self.in_flight[task.id] = task.lease_token
+                    await self.task_queue.put(task)
+                
+                # A full batch means there is a backlog, so go straight back
+                # for more; otherwise sleep until notified, with a fallback
+                # poll for missed notifications. Skipped lanes may have rows
+                # waiting, so also retry once one of them drains.
+                if len(tasks) < limit:
+                    if saturated:
+                        await self.wait_for(self.wakeup, self.space_available)
+                    else:
+                        await self.wait_for(self.wakeup)
                 
             except asyncio.CancelledError:
                 break
@@ -63,112 +264,561 @@ class WorkerPool:
                 print(f"Error fetching tasks: {e}")
                 await asyncio.sleep(5)
     
-    async def notify_new_task(self):
-        """Called when a new task is submitted"""
-        # Trigger immediate check for new tasks
-        pass
+    def apply_handler_limits(self, task_type: str):
+        """Use the handler's concurrency limit for its lane unless configured"""
+        if task_type in self.task_queue.limits:
+            return
+        spec = self.handler_spec(task_type)
+        self.task_queue.limits[task_type] = spec.concurrency if spec else None
     
-    async def worker(self, worker_id: int):
-        """Individual worker that processes tasks"""
-        print(f"Worker {worker_id} started")
+    def handler_spec(self, task_type: str):
+        """Handler settings for limits and retries; None if the handler can't be loaded"""
+        try:
+            return registry.get(task_type)
+        except Exception:
+            return None
+    
+    def update_drain_rate(self):
+        """Refresh the smoothed rate at which workers finish tasks"""
+        now = time.monotonic()
+        elapsed = now - self.rate_checked_at
+        if elapsed < 1:
+            return
+        rate = self.completed_since_check / elapsed
+        self.drain_rate = 0.7 * self.drain_rate + 0.3 * rate
+        self.completed_since_check = 0
+        self.rate_checked_at = now
+    
+    def next_batch_size(self) -> int:
+        """Size the next claim from idle workers and the measured drain rate"""
+        queued = self.task_queue.qsize()
+        idle = self.pool_size - self.busy_workers
+        target = max(idle, math.ceil(self.drain_rate * settings.PREFETCH_HORIZON))
+        free = self.task_queue.maxsize - queued
+        return max(0, min(free, target - queued))
+    
+    async def wait_for(self, *events: asyncio.Event):
+        """Wait for any of the events, giving up after the fallback poll interval"""
+        waiters = [asyncio.ensure_future(event.wait()) for event in events]
+        try:
+            await asyncio.wait(
+                waiters,
+                timeout=settings.POLL_INTERVAL,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+    
+    async def claim_tasks(self, session: AsyncSession, limit: int, exclude_types: list = None, task_type: str = None):
+        """Atomically lock a batch of pending tasks and mark them PROCESSING.
         
+        Rows locked by another fetcher are skipped, so any number of workers
+        and API replicas can claim from the same table without duplicates.
+        The claim's lease_token must match for heartbeats and outcomes to
+        apply, so a node that stalled past its lease can't touch a task
+        that has since been claimed again.
+        """
+        # Scheduled tasks and retries are only PENDING once they are due
+        query = select(Task.id).where(claimable_status())
+        if exclude_types:
+            query = query.where(Task.task_type.notin_(exclude_types))
+        if task_type:
+            query = query.where(Task.task_type == task_type)
+        
+        claimable = (
+            query
+            .order_by(Task.priority.desc(), Task.created_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .cte("claimable")
+        )
+        result = await session.execute(
+            update(Task)
+            .where(Task.id.in_(select(claimable.c.id)))
+            .values(
+                status=TaskStatus.PROCESSING,
+                lease_expires_at=datetime.utcnow() + timedelta(seconds=settings.LEASE_SECONDS),
+                lease_token=uuid.uuid4().hex,
+                updated_at=utc_now()
+            )
+            .returning(Task)
+            .execution_options(synchronize_session=False)
+        )
+        tasks = result.scalars().all()
+        changes = [(task.id, task.task_type, TaskStatus.PROCESSING) for task in tasks]
+        if changes:
+            await task_events.announce(session, changes)
+        await session.commit()
+        task_events.publish(changes)
+        return tasks
+    
+    async def renew_leases(self):
+        """Heartbeat: extend the lease on every task this pool holds"""
         while self.running:
             try:
-                # Get task from queue with timeout
-                task_id = await asyncio.wait_for(
-                    self.task_queue.get(), 
-                    timeout=5.0
-                )
+                await asyncio.sleep(settings.LEASE_SECONDS / 3)
+                if not self.in_flight:
+                    continue
                 
-                await self.process_task(task_id, worker_id)
+                async with async_session_maker() as session:
+                    await session.execute(
+                        update(Task)
+                        .where(
+                            tuple_(Task.id, Task.lease_token).in_(list(self.in_flight.items())),
+                            Task.status == TaskStatus.PROCESSING
+                        )
+                        .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=settings.LEASE_SECONDS))
+                        .execution_options(synchronize_session=False)
+                    )
+                    await session.commit()
                 
-            except asyncio.TimeoutError:
-                continue
             except asyncio.CancelledError:
                 break
             except Exception as e:
-                print(f"Worker {worker_id} error: {e}")
+                print(f"Error renewing leases: {e}")
     
-    async def process_task(self, task_id: int, worker_id: int):
-        """Process a single task with retry logic"""
-        async with async_session_maker() as session:
+    async def reap_expired_leases(self):
+        """Return PROCESSING tasks whose owner stopped heartbeating to PENDING.
+        
+        Each reclaim counts as a retry, so a task that keeps killing the node
+        running it fails once MAX_RETRIES is used up instead of looping.
+        """
+        while self.running:
             try:
-                # Get task
-                result = await session.execute(
-                    select(Task).where(Task.id == task_id)
-                )
-                task = result.scalar_one_or_none()
+                await asyncio.sleep(settings.REAPER_INTERVAL)
+                
+                now = datetime.utcnow()
+                retry_count = func.coalesce(Task.retry_count, 0) + 1
+                exhausted = retry_count >= settings.MAX_RETRIES
+                async with async_session_maker() as session:
+                    result = await session.execute(
+                        update(Task)
+                        .where(
+                            Task.status == TaskStatus.PROCESSING,
+                            or_(
+                                Task.lease_expires_at < now,
+                                # Rows claimed before leases existed
+                                and_(
+                                    Task.lease_expires_at.is_(None),
+                                    Task.updated_at < now - timedelta(seconds=settings.LEASE_SECONDS)
+                                )
+                            )
+                        )
+                        .values(
+                            status=cast(
+                                case((exhausted, TaskStatus.FAILED.name), else_=TaskStatus.PENDING.name),
+                                Task.status.type
+                            ),
+                            retry_count=retry_count,
+                            error_message=case((exhausted, "Lease expired too many times"), else_=Task.error_message),
+                            lease_expires_at=None,
+                            lease_token=None,
+                            updated_at=utc_now()
+                        )
+                        .returning(Task.id, Task.task_type, Task.status)
+                        .execution_options(synchronize_session=False)
+                    )
+                    changes = result.all()
+                    if changes:
+                        await task_events.announce(session, changes)
+                    await session.commit()
+                task_events.publish(changes)
                 
-                if not task or task.status != TaskStatus.PENDING:
-                    return
+                if changes:
+                    failed = sum(status == TaskStatus.FAILED for _, _, status in changes)
+                    print(f"Reclaimed {len(changes)} tasks with expired leases ({failed} failed permanently)")
+                    self.wakeup.set()
                 
-                # Mark as processing
-                task.status = TaskStatus.PROCESSING
-                task.updated_at = datetime.utcnow()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                print(f"Error reaping leases: {e}")
+    
+    async def release_queued_tasks(self):
+        """Put buffered, not yet started tasks back to PENDING"""
+        tasks = self.task_queue.drain()
+        if not tasks:
+            return
+        
+        try:
+            async with async_session_maker() as session:
+                await session.execute(
+                    update(Task)
+                    .where(
+                        tuple_(Task.id, Task.lease_token).in_([(task.id, task.lease_token) for task in tasks]),
+                        Task.status == TaskStatus.PROCESSING
+                    )
+                    .values(status=TaskStatus.PENDING, lease_expires_at=None, lease_token=None, updated_at=utc_now())
+                    .execution_options(synchronize_session=False)
+                )
                 await session.commit()
+            print(f"Released {len(tasks)} queued tasks")
+        except Exception as e:
+            print(f"Error releasing queued tasks: {e}")
+    
+    async def age_pending_tasks(self):
+        """Periodically raise the priority of waiting tasks so none starve.
+        
+        A task that has been claimable for k intervals runs at priority k or
+        higher, up to PRIORITY_AGING_MAX; priorities above that are never
+        reached by aging and stay reserved for urgent work. The update is
+        idempotent, so several nodes can run it, and each task is rewritten
+        at most PRIORITY_AGING_MAX times.
+        """
+        while self.running:
+            try:
+                await asyncio.sleep(settings.PRIORITY_AGING_INTERVAL)
                 
-                print(f"Worker {worker_id} processing task {task_id}")
+                waited = func.extract("epoch", func.timezone("utc", func.now()) - waiting_since())
+                earned = func.least(
+                    settings.PRIORITY_AGING_MAX,
+                    cast(func.floor(waited / settings.PRIORITY_AGING_INTERVAL), Integer)
+                )
+                async with async_session_maker() as session:
+                    await session.execute(
+                        update(Task)
+                        .where(
+                            claimable_status(),
+                            Task.priority < settings.PRIORITY_AGING_MAX,
+                            Task.priority < earned
+                        )
+                        # Not a state change: leave updated_at alone
+                        .values(priority=earned, updated_at=Task.updated_at)
+                        .execution_options(synchronize_session=False)
+                    )
+                    await session.commit()
                 
-                # Execute the actual task
-                result = await self.execute_task(task)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                print(f"Error aging tasks: {e}")
+    
+    async def run_timers(self):
+        """Advance the timing wheel and keep it loaded with upcoming tasks"""
+        while self.running:
+            try:
+                now = time.monotonic()
+                if now >= self.timers_next_load:
+                    await self.load_upcoming_tasks()
+                    self.timers_next_load = now + settings.TIMER_HORIZON
                 
-                # Mark as completed
-                task.status = TaskStatus.COMPLETED
-                task.result = json.dumps(result)
-                task.completed_at = datetime.utcnow()
-                task.updated_at = datetime.utcnow()
-                await session.commit()
+                if self.timers.advance(time.monotonic()):
+                    await self.promote_due_tasks()
                 
-                print(f"Worker {worker_id} completed task {task_id}")
+                await asyncio.sleep(settings.TIMER_TICK)
                 
+            except asyncio.CancelledError:
+                break
             except Exception as e:
-                # Handle failure with retry logic
-                await self.handle_task_failure(session, task, str(e))
+                print(f"Error running timers: {e}")
+                await asyncio.sleep(5)
     
-    async def execute_task(self, task: Task):
-        """Execute the actual task logic - customize this based on task_type"""
-        payload = json.loads(task.payload)
+    async def load_upcoming_tasks(self):
+        """Add tasks due within the next two horizons to the timing wheel.
         
-        # Simulate different task types with FASTER processing
-        if task.task_type == "email":
-            await asyncio.sleep(0.1)  # Changed from 2 to 0.1
-            return {"status": "email_sent", "to": payload.get("email")}
+        Only a sliding window of the schedule is ever held in memory, so any
+        number of far-future tasks can wait in the table. This also picks up
+        tasks scheduled on other nodes or before a restart, and promotes any
+        that fell due without a timer.
+        """
+        await self.promote_due_tasks()
+        until = datetime.utcnow() + timedelta(seconds=2 * settings.TIMER_HORIZON)
+        # Widen the window first, so tasks notified while the query runs
+        # are armed rather than falling between it and the next load
+        loaded_until, self.timers_loaded_until = self.timers_loaded_until, until
+        try:
+            async with async_session_maker() as session:
+                result = await session.execute(
+                    select(Task.id, Task.next_run_at).where(
+                        waiting_status(),
+                        Task.next_run_at > loaded_until,
+                        Task.next_run_at <= until
+                    )
+                )
+        except Exception:
+            self.timers_loaded_until = loaded_until
+            raise
+        for task_id, run_at in result.all():
+            self.schedule(task_id, run_at)
+    
+    async def promote_due_tasks(self):
+        """Make SCHEDULED tasks and retries whose time has come PENDING, so
+        the claim index only ever holds tasks that can run now"""
+        async with async_session_maker() as session:
+            result = await session.execute(
+                update(Task)
+                # The app clock, like the timers and the next_run_at they were armed for
+                .where(waiting_status(), Task.next_run_at <= datetime.utcnow())
+                .values(status=TaskStatus.PENDING, updated_at=utc_now())
+                .returning(Task.id, Task.task_type)
+                .execution_options(synchronize_session=False)
+            )
+            changes = [(task_id, task_type, TaskStatus.PENDING) for task_id, task_type in result.all()]
+            if changes:
+                await task_events.announce(session, changes)
+                # Wake every node's fetcher, not just ours
+                await notify(session, settings.NOTIFY_CHANNEL)
+            await session.commit()
+        task_events.publish(changes)
+        if changes:
+            self.wakeup.set()
+    
+    def schedule(self, task_id: int, run_at: datetime):
+        """Promote and claim tasks due at run_at (UTC), if that falls in the
+        loaded window; later ones are left to load_upcoming_tasks"""
+        if run_at > self.timers_loaded_until:
+            return
+        delay = (run_at - datetime.utcnow()).total_seconds()
+        self.timers.add(task_id, time.monotonic() + delay)
+    
+    def on_notify(self, payload: str):
+        """NOTIFY handler: payload carries comma-separated run times for delayed tasks"""
+        if payload:
+            for run_at in payload.split(","):
+                self.schedule(None, datetime.fromisoformat(run_at))
+        else:
+            self.wakeup.set()
+    
+    def on_listener_reconnect(self):
+        """Catch up on notifications missed while LISTEN was down"""
+        self.timers_loaded_until = datetime.utcnow()
+        self.timers_next_load = 0.0
+        self.wakeup.set()
+    
+    async def notify_new_task(self, run_at: datetime = None):
+        """Called when a new task is submitted"""
+        if run_at:
+            # Our own NOTIFY arms the timer when LISTEN is up
+            if not self.listener:
+                self.schedule(None, run_at)
+        else:
+            # Trigger immediate check for new tasks
+            self.wakeup.set()
+    
+    async def worker(self, worker_id: int):
+        """Individual worker that processes tasks"""
+        print(f"Worker {worker_id} started")
         
-        elif task.task_type == "data_processing":
-            await asyncio.sleep(0.1)  # Changed from 3 to 0.1
-            return {"status": "processed", "records": payload.get("count", 100)}
+        try:
+            while self.running and worker_id not in self.retiring:
+                try:
+                    await self.run_next_task(worker_id)
+                except asyncio.TimeoutError:
+                    continue
+                except asyncio.CancelledError:
+                    break
+                except Exception as e:
+                    print(f"Worker {worker_id} error: {e}")
+        finally:
+            # Retired by the autoscaler (or stopped): leave the pool
+            self.retiring.discard(worker_id)
+            self.worker_ids.remove(worker_id)
+            current = asyncio.current_task()
+            if self.running and current in self.workers:
+                self.workers.remove(current)
+    
+    async def run_next_task(self, worker_id: int):
+        """Take the next task (or batch) from the queue and process it"""
+        # Get claimed task from queue with timeout
+        task = await asyncio.wait_for(
+            self.task_queue.get(), 
+            timeout=5.0
+        )
         
-        elif task.task_type == "report_generation":
-            await asyncio.sleep(0.5)  # Changed from 5 to 0.5
-            return {"status": "generated", "report_id": f"RPT-{task.id}"}
+        self.space_available.set()
+        tasks = [task]
         
-        else:
-            # Default task processing
-            await asyncio.sleep(0.1)  # Changed from 1 to 0.1
-            return {"status": "completed", "data": payload}
-    
-    async def handle_task_failure(self, session: AsyncSession, task: Task, error: str):
-        """Handle task failure with retry logic"""
-        task.retry_count += 1
-        task.error_message = error
-        task.updated_at = datetime.utcnow()
-        
-        if task.retry_count < settings.MAX_RETRIES:
-            # Retry the task
-            task.status = TaskStatus.RETRYING
-            print(f"Task {task.id} failed, retrying ({task.retry_count}/{settings.MAX_RETRIES})")
+        self.busy_workers += 1
+        started = time.monotonic()
+        try:
+            try:
+                spec = registry.get(task.task_type)
+            except Exception as e:
+                # Never fall back to another handler when this type's can't load
+                await self.handle_task_failure(task, f"Failed to load handler: {e}")
+                return
             
-            await session.commit()
+            # Batchable handlers take more tasks of the same type along;
+            # gather_batch appends to tasks so every taken task is accounted for
+            if spec and spec.batchable:
+                await self.gather_batch(tasks, spec)
+                await self.process_batch(tasks, spec, worker_id)
+            else:
+                await self.process_task(task, worker_id)
+        finally:
+            # A batch holds one lane slot, however many tasks it has
+            await self.task_queue.release(task.task_type)
+            self.busy_workers -= 1
+            self.completed_since_check += len(tasks)
+            for done in tasks:
+                self.in_flight.pop(done.id, None)
+            self.space_available.set()
             
-            # Add back to queue after delay
-            await asyncio.sleep(settings.RETRY_DELAY)
-            await self.task_queue.put(task.id)
+            per_task = (time.monotonic() - started) / len(tasks)
+            self.task_latency = 0.8 * self.task_latency + 0.2 * per_task if self.task_latency else per_task
+    
+    async def gather_batch(self, batch: list, spec):
+        """Fill batch, which starts with the task that opened it, with up to
+        spec.batch_size tasks of one type, waiting at most spec.batch_wait
+        seconds. Tasks are appended in place as they are taken"""
+        task = batch[0]
+        batch += self.task_queue.take(task.task_type, spec.batch_size - len(batch))
+        
+        # Claim straight from the table rather than waiting on the fetcher
+        if len(batch) < spec.batch_size:
+            try:
+                async with async_session_maker() as session:
+                    claimed = await self.claim_tasks(
+                        session, spec.batch_size - len(batch), task_type=task.task_type
+                    )
+            except Exception as e:
+                # Only an optimization: run the batch with what we already hold
+                print(f"Error claiming more {task.task_type} tasks for a batch: {e}")
+                claimed = []
+            for extra in claimed:
+                if extra.id not in self.in_flight:
+                    self.in_flight[extra.id] = extra.lease_token
+                    batch.append(extra)
+        
+        if len(batch) < spec.batch_size and spec.batch_wait > 0:
+            batch += await self.task_queue.take_within(
+                task.task_type, spec.batch_size - len(batch), spec.batch_wait
+            )
+    
+    async def process_batch(self, tasks: list, spec, worker_id: int):
+        """Run one handler call for many tasks and store all results in one UPDATE"""
+        print(f"Worker {worker_id} processing batch of {len(tasks)} {spec.task_type} tasks")
+        
+        try:
+            results = await self.execute_batch(tasks, spec)
+            if len(results) != len(tasks):
+                raise ValueError(f"Batch handler returned {len(results)} results for {len(tasks)} tasks")
+        except Exception as e:
+            results = [e] * len(tasks)
+        
+        # Handlers may return an exception in place of a result to fail one item;
+        # the writer coalesces all of these into one transaction
+        outcomes = []
+        for task, result in zip(tasks, results):
+            if isinstance(result, Exception):
+                outcomes.append(self.handle_task_failure(task, str(result)))
+            else:
+                outcomes.append(self.writer.complete(task, json.dumps(result)))
+        await asyncio.gather(*outcomes)
+        
+        failed = sum(isinstance(result, Exception) for result in results)
+        print(f"Worker {worker_id} completed {len(tasks) - failed}/{len(tasks)} {spec.task_type} tasks")
+    
+    async def execute_batch(self, tasks: list, spec) -> list:
+        """Call a batch handler with the payloads and ids of all tasks"""
+        payloads = [json.loads(task.payload) for task in tasks]
+        task_ids = [task.id for task in tasks]
+        if spec.mode == "thread":
+            return await self.executors.run_in_thread(spec.func, payloads, task_ids, spec.timeout)
+        return await self.run_with_timeout(spec.func(payloads, task_ids), spec.timeout)
+    
+    async def process_task(self, task: Task, worker_id: int):
+        """Process a single claimed task with retry logic"""
+        # Task was already marked PROCESSING by the claim
+        try:
+            print(f"Worker {worker_id} processing task {task.id}")
             
-            # Reset to pending for retry
-            task.status = TaskStatus.PENDING
-            await session.commit()
+            # Execute the actual task
+            result = await self.execute_task(task)
+        except Exception as e:
+            # Handle failure with retry logic
+            await self.handle_task_failure(task, str(e))
+            return
+        
+        # Mark as completed; returns once the writer has committed it
+        await self.writer.complete(task, json.dumps(result))
+        print(f"Worker {worker_id} completed task {task.id}")
+    
+    async def execute_task(self, task: Task):
+        """Execute the task with the handler registered for its task_type"""
+        spec = registry.get(task.task_type)
+        if spec is None:
+            raise ValueError(f"No handler registered for task type '{task.task_type}'")
+        
+        if spec.mode == "process":
+            # CPU-heavy handlers run on other cores so they don't stall the loop
+            return await self.run_with_timeout(
+                self.executors.run_in_process(spec.func, task.payload, task.id), spec.timeout
+            )
+        
+        payload = json.loads(task.payload)
+        if spec.mode == "thread":
+            # Handlers built on blocking client libraries run in the I/O pool
+            return await self.executors.run_in_thread(spec.func, payload, task.id, spec.timeout)
+        
+        return await self.run_with_timeout(spec.func(payload, task.id), spec.timeout)
+    
+    async def run_with_timeout(self, coro, timeout: float = None):
+        if timeout is None:
+            return await coro
+        try:
+            return await asyncio.wait_for(coro, timeout=timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Handler timed out after {timeout}s")
+    
+    async def handle_task_failure(self, task: Task, error: str):
+        """Handle task failure with retry logic"""
+        retry_count = (task.retry_count or 0) + 1
+        spec = self.handler_spec(task.task_type)
+        max_retries = spec.max_retries if spec and spec.max_retries is not None else settings.MAX_RETRIES
+        
+        if retry_count < max_retries:
+            # Persist the retry time and free the worker right away; the
+            # task is promoted back to PENDING once next_run_at has passed
+            delay = self.backoff_delay(task.task_type, retry_count)
+            next_run_at = datetime.utcnow() + timedelta(seconds=delay)
+            print(f"Task {task.id} failed, retrying in {delay:.1f}s ({retry_count}/{max_retries})")
+            
+            await self.writer.fail(task, TaskStatus.RETRYING, error, retry_count, next_run_at)
+            self.schedule(task.id, next_run_at)
         else:
             # Max retries reached
-            task.status = TaskStatus.FAILED
-            print(f"Task {task.id} failed permanently after {task.retry_count} retries")
-            await session.commit()
\ No newline at end of file
+            print(f"Task {task.id} failed permanently after {retry_count} retries")
+            await self.writer.fail(task, TaskStatus.FAILED, error, retry_count)
+    
+    def backoff_delay(self, task_type: str, attempt: int) -> float:
+        """Exponential backoff with equal jitter, configurable per task type"""
+        spec = self.handler_spec(task_type)
+        base = settings.RETRY_BACKOFF.get(task_type)
+        if base is None:
+            base = spec.retry_backoff if spec and spec.retry_backoff is not None else settings.RETRY_DELAY
+        delay = min(settings.RETRY_MAX_DELAY, base * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+async def run_standalone(concurrency: int):
+    """Run a worker pool without the API until SIGINT/SIGTERM"""
+    # Nothing here serves reads, and task_events isn't listening for evictions
+    task_cache.disable()
+    await init_db()
+    pool = WorkerPool(pool_size=concurrency)
+    await pool.start()
+    print(f"✅ Worker process started with {pool.pool_size} workers")
+    
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    await stopping.wait()
+    
+    await pool.stop()
+    await engine.dispose()
+    print("🛑 Worker process stopped")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run task workers without the API")
+    parser.add_argument(
+        "--concurrency", type=int, default=settings.WORKER_POOL_SIZE,
+        help="number of concurrent workers (default: WORKER_POOL_SIZE)"
+    )
+    args = parser.parse_args()
+    asyncio.run(run_standalone(args.concurrency))
+
+if __name__ == "__main__":
+    main()
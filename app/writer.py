@@ -0,0 +1,198 @@
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import select, update, values, column, cast, Integer, Text, DateTime
+
+from app.database import async_session_maker
+from app.models import Task, TaskStatus, utc_now
+from app.config import settings
+from app.cache import task_cache, TERMINAL_STATUSES
+from app.events import task_events
+from app.schemas import TaskResponse
+
+class CompletionWriter:
+    """Single writer that coalesces task state updates into bulk UPDATEs.
+
+    Workers hand over completions and failures and await an ack. The writer
+    collects whatever arrives within WRITER_FLUSH_INTERVAL (up to
+    WRITER_BATCH_SIZE items) and stores it with one UPDATE ... FROM (VALUES ...)
+    per kind of update, in a single transaction. The ack resolves once that
+    transaction has committed, and the changes are published as task events;
+    terminal rows also go into the local task cache. An outcome is only
+    written while the task still holds the lease_token it was claimed with.
+    """
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.runner = None
+
+    def start(self):
+        self.runner = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Flush everything already submitted, then stop"""
+        if self.runner:
+            self.queue.put_nowait(None)
+            await self.runner
+            self.runner = None
+
+    async def complete(self, task: Task, result: str):
+        """Store a COMPLETED result; returns once it is committed"""
+        await self.submit({"task": task, "status": TaskStatus.COMPLETED, "result": result})
+
+    async def fail(self, task: Task, status: TaskStatus, error: str, retry_count: int, next_run_at: datetime = None):
+        """Store a RETRYING or FAILED outcome; returns once it is committed"""
+        await self.submit({
+            "task": task,
+            "status": status,
+            "error_message": error,
+            "retry_count": retry_count,
+            "next_run_at": next_run_at
+        })
+
+    async def submit(self, item: dict):
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((item, future))
+        await future
+
+    async def run(self):
+        """Write batches until stopped; an error only fails its own batch"""
+        stopping = False
+        while not stopping:
+            entry = await self.queue.get()
+            if entry is None:
+                break
+
+            batch = [entry]
+            try:
+                # Linger briefly so concurrent completions share the transaction
+                if self.queue.qsize() < settings.WRITER_BATCH_SIZE - 1:
+                    await asyncio.sleep(settings.WRITER_FLUSH_INTERVAL)
+
+                while len(batch) < settings.WRITER_BATCH_SIZE and not self.queue.empty():
+                    entry = self.queue.get_nowait()
+                    if entry is None:
+                        stopping = True
+                        break
+                    batch.append(entry)
+
+                await self.flush(batch)
+            except Exception as e:
+                print(f"Error in completion writer: {e}")
+            finally:
+                # Workers wait on these; never leave one unresolved
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(RuntimeError("Task update was not written"))
+
+    async def flush(self, batch: list):
+        items = [item for item, _ in batch]
+        try:
+            async with async_session_maker() as session:
+                # Stamp from the database clock, like every other update
+                now = (await session.execute(select(utc_now()))).scalar()
+                written = await self.write(session, items, now)
+                if len(written) < len(items):
+                    print(f"Dropped {len(items) - len(written)} task updates from claims whose lease was lost")
+                items = [item for item in items if item["task"].id in written]
+                changes = [(item["task"].id, item["task"].task_type, item["status"]) for item in items]
+                await task_events.announce(session, changes)
+                await session.commit()
+        except Exception as e:
+            print(f"Error writing {len(items)} task updates: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Committed: the acks succeed even if publishing locally fails.
+        # Publishing evicts the old rows, so cache the new ones after it
+        try:
+            task_events.publish(changes)
+            self.cache_outcomes(items, now)
+        except Exception as e:
+            print(f"Error publishing {len(changes)} task updates: {e}")
+        finally:
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+    def cache_outcomes(self, items: list, now: datetime):
+        """Keep committed COMPLETED and FAILED rows for reads on this node"""
+        if task_cache.max_bytes <= 0:
+            return
+        for item in items:
+            if item["status"] not in TERMINAL_STATUSES:
+                continue
+            # The claimed row plus the columns this write changed
+            task = item["task"]
+            row = {name: getattr(task, name) for name in TaskResponse.model_fields}
+            row.update({key: value for key, value in item.items() if key in row})
+            row["updated_at"] = now
+            if item["status"] == TaskStatus.COMPLETED:
+                row["completed_at"] = now
+            task_cache.put(row)
+
+    async def write(self, session, items: list, now: datetime) -> set:
+        """Apply the outcomes; returns the ids whose lease still matched"""
+        completed = [
+            (item["task"].id, item["task"].lease_token, item["result"])
+            for item in items if item["status"] == TaskStatus.COMPLETED
+        ]
+        failed = [
+            (
+                item["task"].id, item["task"].lease_token, item["status"].name,
+                item["error_message"], item["retry_count"], item["next_run_at"]
+            )
+            for item in items if item["status"] != TaskStatus.COMPLETED
+        ]
+        written = set()
+
+        if completed:
+            rows = values(
+                column("id", Integer), column("lease_token", Text), column("result", Text), name="completed"
+            ).data(completed)
+            result = await session.execute(
+                update(Task)
+                .where(Task.id == cast(rows.c.id, Integer), Task.lease_token == cast(rows.c.lease_token, Text))
+                .values(
+                    status=TaskStatus.COMPLETED,
+                    result=cast(rows.c.result, Text),
+                    lease_expires_at=None,
+                    lease_token=None,
+                    completed_at=now,
+                    updated_at=now
+                )
+                .returning(Task.id)
+                .execution_options(synchronize_session=False)
+            )
+            written.update(result.scalars())
+
+        if failed:
+            rows = values(
+                column("id", Integer),
+                column("lease_token", Text),
+                column("status", Text),
+                column("error_message", Text),
+                column("retry_count", Integer),
+                column("next_run_at", DateTime),
+                name="failed"
+            ).data(failed)
+            result = await session.execute(
+                update(Task)
+                .where(Task.id == cast(rows.c.id, Integer), Task.lease_token == cast(rows.c.lease_token, Text))
+                .values(
+                    status=cast(rows.c.status, Task.status.type),
+                    error_message=cast(rows.c.error_message, Text),
+                    retry_count=cast(rows.c.retry_count, Integer),
+                    next_run_at=cast(rows.c.next_run_at, DateTime),
+                    lease_expires_at=None,
+                    lease_token=None,
+                    updated_at=now
+                )
+                .returning(Task.id)
+                .execution_options(synchronize_session=False)
+            )
+            written.update(result.scalars())
+
+        return written
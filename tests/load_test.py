@@ -62,6 +62,20 @@ class TaskProcessingUser(HttpUser):
                 else:
                     response.failure(f"Failed with status {response.status_code}")
     
+    @task(2)  # Weight: 2
+    def check_task_statuses(self):
+        """Check the status of every submitted task in one request"""
+        if self.task_ids:
+            with self.client.post(
+                "/tasks/status:bulk",
+                json={"ids": self.task_ids[-1000:]},
+                catch_response=True
+            ) as response:
+                if response.status_code == 200:
+                    response.success()
+                else:
+                    response.failure(f"Failed with status {response.status_code}")
+    
     @task(2)  # Weight: 2
     def get_all_tasks(self):
         """Get all tasks"""
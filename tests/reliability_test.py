@@ -48,18 +48,18 @@ async def test_reliability(num_tasks=500):
         submit_time = time.time() - start_time
         print(f"✅ Submitted {results['submitted']}/{num_tasks} tasks in {submit_time:.2f}s")
         
-        # Wait for processing
-        print("\n⏳ Waiting 60 seconds for tasks to process...")
-        await asyncio.sleep(60)
-        
-        # Check status of all tasks
-        print("\n🔍 Checking task status...")
+        # Wait for processing: each request returns as soon as its task
+        # finishes, and all of them share one 60 second deadline
+        print("\n⏳ Waiting up to 60 seconds for tasks to process...")
+        deadline = time.time() + 60
         
         for task_id in task_ids:
             try:
+                timeout = max(0, deadline - time.time())
                 async with session.get(
-                    f"http://localhost:8000/tasks/{task_id}",
-                    timeout=aiohttp.ClientTimeout(total=5)
+                    f"http://localhost:8000/tasks/{task_id}/wait",
+                    params={"timeout": timeout},
+                    timeout=aiohttp.ClientTimeout(total=timeout + 5)
                 ) as response:
                     if response.status == 200:
                         task = await response.json()
@@ -0,0 +1,71 @@
+import asyncio
+import aiohttp
+import time
+import statistics
+
+BASE_URL = "http://localhost:8000"
+
+async def submit_task(session, task_num):
+    """Submit a single task and return its latency in milliseconds"""
+    payload = {
+        "task_type": "email",
+        "payload": {"task_number": task_num}
+    }
+    start_time = time.perf_counter()
+    async with session.post(f"{BASE_URL}/tasks", json=payload) as response:
+        await response.read()
+        elapsed = (time.perf_counter() - start_time) * 1000
+        return elapsed if response.status == 201 else None
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+async def run_latency_test(num_tasks, concurrency):
+    """Measure POST /tasks latency with a fixed number of requests in flight"""
+    print(f"\n{'='*60}")
+    print(f"POST /tasks latency: {num_tasks} requests, {concurrency} in flight")
+    print(f"{'='*60}\n")
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(session, task_num):
+        async with semaphore:
+            return await submit_task(session, task_num)
+
+    async with aiohttp.ClientSession() as session:
+        # Warm up connections and the server's pool
+        await asyncio.gather(*[submit_task(session, -i) for i in range(concurrency)])
+
+        start_time = time.perf_counter()
+        results = await asyncio.gather(*[bounded(session, i) for i in range(num_tasks)])
+        total_time = time.perf_counter() - start_time
+
+    latencies = [r for r in results if r is not None]
+    failed = len(results) - len(latencies)
+
+    print(f"✅ Successful: {len(latencies)}")
+    print(f"❌ Failed: {failed}")
+    print(f"⚡ Throughput: {len(latencies) / total_time:.2f} requests/second")
+    if latencies:
+        print(f"\n📊 Latency (ms):")
+        print(f"   Mean: {statistics.mean(latencies):.2f}")
+        print(f"   p50:  {percentile(latencies, 50):.2f}")
+        print(f"   p95:  {percentile(latencies, 95):.2f}")
+        print(f"   p99:  {percentile(latencies, 99):.2f}")
+        print(f"   Max:  {max(latencies):.2f}")
+
+async def main():
+    """Run against the same server before and after a change to compare"""
+    print("🚀 Starting submit latency benchmark")
+
+    # Sequential requests show per-request round trips; concurrent ones
+    # show how long each request holds a pooled connection
+    await run_latency_test(500, 1)
+    await run_latency_test(2000, 20)
+    await run_latency_test(5000, 100)
+
+    print("\n✅ Benchmark complete")
+
+if __name__ == "__main__":
+    asyncio.run(main())
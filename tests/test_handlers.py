@@ -0,0 +1,93 @@
+import sys
+import textwrap
+
+import pytest
+
+from app import handlers
+from app.handlers import HandlerRegistry
+
+@pytest.fixture
+def make_registry(tmp_path, monkeypatch):
+    """Build a registry whose handler modules are written to tmp_path"""
+    monkeypatch.syspath_prepend(str(tmp_path))
+    created = []
+
+    def make(builtins: dict, user_modules: dict, modules: dict):
+        for name, source in {**builtins, **user_modules}.items():
+            (tmp_path / f"{name}.py").write_text(textwrap.dedent(source))
+            created.append(name)
+        registry = HandlerRegistry(modules, builtins=tuple(builtins))
+        # Handler modules register through app.handlers.registry
+        monkeypatch.setattr(handlers, "registry", registry)
+        return registry
+
+    yield make
+    for name in created:
+        sys.modules.pop(name, None)
+
+BUILTINS = {
+    "fake_builtins": """
+        from app import handlers
+
+        @handlers.registry.register("email", batchable=True)
+        async def send_emails(payloads, task_ids):
+            return payloads
+
+        @handlers.registry.register("report_generation")
+        async def generate_report(payload, task_id):
+            return payload
+
+        @handlers.registry.register("*")
+        async def default_task(payload, task_id):
+            return payload
+    """
+}
+
+def test_builtins_do_not_replace_a_user_override(make_registry):
+    registry = make_registry(BUILTINS, {
+        "user_email": """
+            from app import handlers
+
+            @handlers.registry.register("email", mode="thread", override=True)
+            def send_email(payload, task_id):
+                return payload
+        """
+    }, {"email": "user_email"})
+
+    assert registry.get("email").func.__module__ == "user_email"
+    # Looking up other types used to import the built-ins over the override
+    assert registry.get("report_generation").func.__module__ == "fake_builtins"
+    assert registry.get("unknown_type").task_type == "*"
+    assert registry.get("email").func.__module__ == "user_email"
+    assert registry.get("email").mode == "thread"
+
+def test_registering_a_type_twice_needs_override(make_registry):
+    registry = make_registry(BUILTINS, {}, {})
+
+    with pytest.raises(ValueError):
+        registry.register("email")(lambda payload, task_id: payload)
+    assert registry.get("email").func.__module__ == "fake_builtins"
+
+def test_failed_import_raises_instead_of_falling_back(make_registry):
+    registry = make_registry(BUILTINS, {
+        "broken_invoices": """
+            from app import handlers
+
+            @handlers.registry.register("invoice")
+            async def send_invoice(payload, task_id):
+                return payload
+
+            raise RuntimeError("missing dependency")
+        """
+    }, {"invoice": "broken_invoices", "refund": "myapp.does_not_exist"})
+
+    for _ in range(2):
+        with pytest.raises(ModuleNotFoundError):
+            registry.get("refund")
+        # The partial registration is undone, so a retry fails the same way
+        with pytest.raises(RuntimeError):
+            registry.get("invoice")
+
+    assert "refund" not in registry.specs
+    assert "invoice" not in registry.specs
+    assert registry.get("unknown_type").task_type == "*"
@@ -0,0 +1,173 @@
+import asyncio
+import math
+import random
+from collections import Counter
+from types import SimpleNamespace
+
+from app.scheduler import LaneScheduler, TimingWheel
+
+# LaneScheduler's condition binds to the loop that first uses it, so each
+# test runs start to finish inside one asyncio.run
+
+async def fill(scheduler: LaneScheduler, counts: dict):
+    """Queue counts[task_type] tasks of each type, in that order"""
+    for task_type, count in counts.items():
+        for number in range(count):
+            await scheduler.put(SimpleNamespace(task_type=task_type, number=number))
+
+async def pick(scheduler: LaneScheduler, count: int, release: bool = True) -> list:
+    """Task types of the next count tasks the schedule hands out"""
+    picked = []
+    for _ in range(count):
+        task = await asyncio.wait_for(scheduler.get(), timeout=1)
+        picked.append(task.task_type)
+        if release:
+            await scheduler.release(task.task_type)
+    return picked
+
+def test_lanes_are_served_in_proportion_to_their_weights():
+    async def scenario():
+        scheduler = LaneScheduler(maxsize=1000, weights={"email": 4, "data_processing": 2})
+        await fill(scheduler, {"email": 100, "data_processing": 100, "report_generation": 100})
+
+        counts = Counter(await pick(scheduler, 70))
+        assert counts == {"email": 40, "data_processing": 20, "report_generation": 10}
+    asyncio.run(scenario())
+
+def test_a_lane_that_runs_dry_leaves_its_share_to_the_others():
+    async def scenario():
+        scheduler = LaneScheduler(maxsize=1000, weights={"email": 4})
+        await fill(scheduler, {"email": 100, "report_generation": 2})
+
+        assert Counter(await pick(scheduler, 30)) == {"email": 28, "report_generation": 2}
+        assert "report_generation" not in scheduler.stats()
+    asyncio.run(scenario())
+
+def test_capped_lane_never_runs_more_than_its_limit():
+    async def scenario():
+        scheduler = LaneScheduler(maxsize=1000, limits={"report_generation": 2})
+        await fill(scheduler, {"report_generation": 5, "email": 3})
+
+        picked = await pick(scheduler, 5, release=False)
+        assert Counter(picked) == {"report_generation": 2, "email": 3}
+        assert scheduler.saturated_lanes() == ["report_generation"]
+
+        waiting = asyncio.ensure_future(scheduler.get())
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        await scheduler.release("report_generation")
+        assert (await asyncio.wait_for(waiting, timeout=1)).task_type == "report_generation"
+    asyncio.run(scenario())
+
+def test_dropping_a_lane_before_the_cursor_keeps_the_rotation():
+    async def scenario():
+        scheduler = LaneScheduler(maxsize=1000)
+        await fill(scheduler, {"a": 1, "b": 1, "c": 3})
+
+        # Hold a and b running so they stay in the order while the cursor moves on
+        assert await pick(scheduler, 4, release=False) == ["b", "c", "a", "c"]
+        assert scheduler.order[scheduler.cursor] == "c"
+
+        await scheduler.release("a")
+        assert scheduler.order == ["b", "c"]
+        assert scheduler.order[scheduler.cursor] == "c"
+
+        await scheduler.release("b")
+        assert scheduler.order == ["c"]
+        assert scheduler.cursor == 0
+
+        await scheduler.release("c")
+        await scheduler.release("c")
+        assert await pick(scheduler, 1) == ["c"]
+        assert scheduler.stats() == {}
+    asyncio.run(scenario())
+
+def test_lane_moved_under_the_cursor_gets_its_turn():
+    async def scenario():
+        scheduler = LaneScheduler(maxsize=1000)
+        await fill(scheduler, {"a": 1, "b": 2, "c": 2})
+
+        # a is dropped while the cursor is on it and b slides into its place;
+        # without its quantum b would be skipped and c served twice in a row
+        assert await pick(scheduler, 5) == ["b", "c", "a", "b", "c"]
+    asyncio.run(scenario())
+
+def test_dropped_lane_forgets_limits_it_was_given_but_keeps_configured_ones():
+    async def scenario():
+        scheduler = LaneScheduler(maxsize=1000, limits={"a": 1})
+        scheduler.limits["b"] = 3  # as the worker sets from a handler's concurrency
+        await fill(scheduler, {"a": 1, "b": 1})
+
+        await pick(scheduler, 2)
+        assert scheduler.lanes == {}
+        assert scheduler.limits == {"a": 1}
+    asyncio.run(scenario())
+
+def test_drain_returns_queued_tasks_and_keeps_lanes_with_running_tasks():
+    async def scenario():
+        scheduler = LaneScheduler(maxsize=1000)
+        await fill(scheduler, {"a": 2, "b": 3})
+
+        assert await pick(scheduler, 1, release=False) == ["b"]
+        drained = scheduler.drain()
+        assert Counter(task.task_type for task in drained) == {"a": 2, "b": 2}
+        assert scheduler.qsize() == 0
+        assert scheduler.order == ["b"]
+
+        await scheduler.release("b")
+        assert scheduler.order == []
+    asyncio.run(scenario())
+
+def small_wheel(now: float = 0.0) -> TimingWheel:
+    """4 slots per level and 2 levels: level 0 spans 4 ticks, level 1 16, the
+    rest overflows, so a short test crosses every cascade"""
+    return TimingWheel(tick=1.0, slot_bits=2, levels=2, now=now)
+
+def test_wheel_fires_each_timer_on_the_first_tick_at_or_after_due():
+    rng = random.Random(7)
+    wheel = small_wheel()
+    dues = {key: rng.uniform(0, 200) for key in range(500)}
+    for key, due in dues.items():
+        wheel.add(key, due)
+    assert len(wheel) == len(dues)
+
+    fired = {}
+    for now in range(1, 202):
+        for key in wheel.advance(now):
+            assert key not in fired
+            fired[key] = now
+
+    assert len(wheel) == 0
+    for key, due in dues.items():
+        assert fired[key] == max(1, math.ceil(due))
+
+def test_wheel_never_fires_early_when_advanced_in_jumps():
+    rng = random.Random(11)
+    wheel = small_wheel(now=1000.0)
+    dues = {}
+    fires_at = {}  # tick each timer must fire on
+    fired = set()
+    now = 1000.0
+    for round_number in range(200):
+        # Timers are added as time moves, some already due, some past the overflow
+        for key in range(round_number * 5, round_number * 5 + 5):
+            dues[key] = now + rng.uniform(-5, 100)
+            fires_at[key] = max(wheel.current + 1, math.ceil(dues[key]))
+            wheel.add(key, dues[key])
+        now += rng.choice([0.3, 1, 3.7, 16, 41])
+        for key in wheel.advance(now):
+            assert dues[key] <= now
+            fired.add(key)
+        # Nothing whose tick has passed is still waiting
+        assert {key for key, tick in fires_at.items() if tick <= now} == fired
+
+    now += 200
+    fired.update(wheel.advance(now))
+    assert fired == set(dues)
+    assert len(wheel) == 0
+
+def test_wheel_timer_in_the_past_fires_on_the_next_tick():
+    wheel = small_wheel(now=50.0)
+    wheel.add("late", 10.0)
+    assert wheel.advance(50.5) == []
+    assert wheel.advance(51.0) == ["late"]